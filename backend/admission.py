@@ -0,0 +1,334 @@
+"""
+Cost-based admission control
+
+Estimates the peak working memory of a request from cheap reads (image
+dimensions, PDF page count and decoded content stream sizes) before any
+processing, and
+admits requests against a per-process memory budget. Requests wait while
+the budget is exhausted and are rejected if they would never fit or the
+wait exceeds the queue timeout.
+"""
+
+import asyncio
+import logging
+import os
+import re
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+import pikepdf
+from PIL import Image
+
+from buffers import open_buffer
+from image_process import BUFFERED_FRAME_FORMATS, count_frames
+from redact import WATERMARK_MIN_TEXT_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+# Per-process budget; with several uvicorn workers each gets its own
+MEMORY_BUDGET_BYTES = int(os.environ.get("MEMORY_BUDGET_MB", "256")) * 2**20
+QUEUE_TIMEOUT_SECONDS = float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", "30"))
+
+# Peak working memory of each image method, measured with
+# `python loadtest.py --calibrate` (peak RSS of a fresh process):
+# copies of the decoded 8-bit BGR frame held for the whole request, plus
+# bytes per pixel of the regions being processed
+IMAGE_WORKING_COPIES = {
+    'inpaint': 2.2,   # decoded + mask + encoded result
+    'auto': 2.6,      # inpaint + grayscale detection buffers; regions unknown
+    'cover': 2.8,     # PIL RGB image drawn in place + encoder
+    'unblend': 2.2,   # decoded + encoded result; float32 work is per band
+}
+IMAGE_REGION_PIXEL_BYTES = {
+    'inpaint': 20,    # float32 fill patch / pyramid crops
+    'auto': 0,
+    'cover': 0,
+    'unblend': 3,     # opacity projection, one band of rows at a time
+}
+# Interpreter, codec and allocator overhead that small images still pay
+IMAGE_OVERHEAD_BYTES = 6 * 2**20
+
+# Decoded content stream bytes held per touched page: cover keeps the old
+# and new streams side by side; delete parses every operator into Python
+# and QPDF objects (about 60x the stream text)
+PDF_CONTENT_EXPANSION = 6
+PDF_DELETE_EXPANSION = 68
+# Upload + output buffer
+PDF_FILE_COPIES = 2
+PDF_PAGE_OVERHEAD_BYTES = 16 * 1024
+# Image downsampling (optimize with target_dpi) holds the decoded image,
+# its resized copy and the re-encoded stream
+PDF_DOWNSAMPLE_COPIES = 3
+
+# /analyze indexes one page at a time (the largest page sets the parse
+# peak) and keeps every image / XObject placement and every rotated,
+# translucent or large text run as a possible repeat across pages (about
+# 1.3KB each)
+ANALYZE_PARSE_EXPANSION = 20
+ANALYZE_OBJECT_BYTES = 1344
+# Content stream operators that draw a text run / place an XObject or
+# inline image, and the ones that can make text look like a stamp
+TEXT_OPERATORS = re.compile(rb"""(?:Tj|TJ|'|")(?=[\s\[\]/<>()]|$)""")
+PLACEMENT_OPERATORS = re.compile(rb"(?:Do|BI)(?=[\s\[\]/<>()]|$)")
+STATE_OPERATOR = re.compile(rb"\sgs(?=\s|$)")
+MATRIX_OPERATOR = re.compile(rb"(\S+)\s+(\S+)\s+(\S+)\s+(\S+)\s+\S+\s+\S+\s+(?:Tm|cm)(?=\s|$)")
+FONT_SIZE_OPERATOR = re.compile(rb"(\S+)\s+Tf(?=\s|$)")
+
+
+class AdmissionRejected(Exception):
+    """Request cannot be admitted under the memory budget"""
+
+    def __init__(self, message: str, status_code: int):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def estimate_image_cost(
+    image_bytes: bytes,
+    method: str = 'inpaint',
+    regions: Optional[List[Tuple[int, int, int, int]]] = None
+) -> int:
+    """
+    Estimate peak bytes needed to process an image
+
+    Reads only the header: width x height x 3 channels x working copies,
+    plus the area of the regions (whole image when not given) x the
+    method's bytes per region pixel, times the frames in flight for
+    multi-frame files, plus the upload.
+    """
+    try:
+        img = Image.open(open_buffer(image_bytes))
+        width, height = img.size
+        container = img.format
+    except Exception:
+        # Undecodable: validation rejects it before any real work
+        return len(image_bytes)
+
+    if method not in IMAGE_WORKING_COPIES or (method == 'inpaint' and not regions):
+        # Without regions inpainting auto-detects them first
+        method = 'auto'
+
+    frame_bytes = width * height * 3
+    region_pixels = width * height
+    if regions:
+        region_pixels = sum(
+            max(0, min(x + w, width) - max(x, 0)) * max(0, min(y + h, height) - max(y, 0))
+            for x, y, w, h in regions
+        )
+    per_frame = (
+        frame_bytes * IMAGE_WORKING_COPIES[method]
+        + region_pixels * IMAGE_REGION_PIXEL_BYTES[method]
+    )
+
+    frames = count_frames(image_bytes)
+    if frames > 1:
+        # Frames in flight on the pool, plus every processed frame the
+        # GIF / WebP / APNG writers keep, at roughly one decoded frame each
+        in_flight = min(frames, 2 * (os.cpu_count() or 1))
+        working = per_frame * in_flight
+        if container in BUFFERED_FRAME_FORMATS:
+            working += frame_bytes * frames
+    else:
+        working = per_frame
+
+    return int(working) + IMAGE_OVERHEAD_BYTES + len(image_bytes)
+
+
+def estimate_pdf_cost(
+    pdf_bytes: bytes,
+    actions: List[Dict[str, Any]],
+    target_dpi: Optional[int] = None
+) -> int:
+    """
+    Estimate peak bytes needed to redact a PDF
+
+    Uses the page count and the decoded size of the content streams that
+    the actions touch, weighted by whether the page gets deletes, plus the
+    largest image when images are downsampled. Only the touched pages'
+    content streams are decompressed.
+    """
+    try:
+        pdf = pikepdf.Pdf.open(open_buffer(pdf_bytes))
+    except Exception:
+        return len(pdf_bytes)
+
+    try:
+        page_count = len(pdf.pages)
+        pages = {}
+        for action in actions:
+            if isinstance(action, dict):
+                page_num = action.get("page", 0)
+                deletes = action.get("method") == "delete"
+                pages[page_num] = pages.get(page_num, False) or deletes
+
+        content_bytes = 0
+        for page_num, deletes in pages.items():
+            if not isinstance(page_num, int) or not 0 <= page_num < page_count:
+                continue
+            expansion = PDF_DELETE_EXPANSION if deletes else PDF_CONTENT_EXPANSION
+            content_bytes += expansion * _content_stream_size(pdf.pages[page_num])
+
+        image_bytes = 0
+        if target_dpi:
+            image_bytes = PDF_DOWNSAMPLE_COPIES * _largest_image_size(pdf)
+    except Exception:
+        content_bytes = PDF_DELETE_EXPANSION * len(pdf_bytes)
+        image_bytes = 0
+        page_count = 0
+    finally:
+        pdf.close()
+
+    return (
+        PDF_FILE_COPIES * len(pdf_bytes)
+        + content_bytes
+        + image_bytes
+        + PDF_PAGE_OVERHEAD_BYTES * page_count
+    )
+
+
+def estimate_analyze_cost(pdf_bytes: bytes) -> int:
+    """
+    Estimate peak bytes needed to find watermark candidates (/analyze)
+
+    Pages are indexed one at a time, so only the largest page's parse
+    counts, plus the drawn objects kept from every page. Text runs only
+    count on pages that may draw stamp-like text (see _may_draw_stamps);
+    upright, opaque body text is skipped by /analyze. Decompresses every
+    content stream (run it off the event loop).
+    """
+    try:
+        pdf = pikepdf.Pdf.open(open_buffer(pdf_bytes))
+    except Exception:
+        return len(pdf_bytes)
+
+    largest_page = 0
+    objects = 0
+    try:
+        for page in pdf.pages:
+            page_bytes = 0
+            text_runs = 0
+            stamps = False
+            for data in _content_streams(page):
+                page_bytes += len(data)
+                text_runs += len(TEXT_OPERATORS.findall(data))
+                objects += len(PLACEMENT_OPERATORS.findall(data))
+                stamps = stamps or _may_draw_stamps(data)
+            if stamps:
+                objects += text_runs
+            largest_page = max(largest_page, page_bytes)
+    except Exception:
+        largest_page = len(pdf_bytes)
+    finally:
+        pdf.close()
+
+    return (
+        PDF_FILE_COPIES * len(pdf_bytes)
+        + ANALYZE_PARSE_EXPANSION * largest_page
+        + ANALYZE_OBJECT_BYTES * objects
+    )
+
+
+def _may_draw_stamps(data: bytes) -> bool:
+    """
+    Whether a content stream may draw rotated, translucent or large text
+
+    Looks for graphics state changes (possible transparency), rotated or
+    skewed matrices, and text matrices or font sizes of stamp size.
+    Matrices and font sizes multiply, so this can miss small fonts scaled
+    up in two steps; the estimate then leaves out their retained objects.
+    """
+    if STATE_OPERATOR.search(data):
+        return True
+    try:
+        for match in MATRIX_OPERATOR.finditer(data):
+            a, b, c, d = (float(v) for v in match.groups())
+            if b or c or max(abs(a), abs(d)) >= WATERMARK_MIN_TEXT_SIZE:
+                return True
+        for match in FONT_SIZE_OPERATOR.finditer(data):
+            if abs(float(match.group(1))) >= WATERMARK_MIN_TEXT_SIZE:
+                return True
+    except ValueError:
+        return True
+    return False
+
+
+def _content_streams(page) -> List[bytes]:
+    """Decoded content streams of a page"""
+    if "/Contents" not in page:
+        return []
+    contents = page.Contents
+    streams = contents if isinstance(contents, pikepdf.Array) else [contents]
+    return [stream.read_bytes() for stream in streams]
+
+
+def _content_stream_size(page) -> int:
+    """Decoded size of a page's content streams"""
+    return sum(len(data) for data in _content_streams(page))
+
+
+def _largest_image_size(pdf: pikepdf.Pdf) -> int:
+    """Decoded 8-bit RGB size of the largest image XObject (header reads only)"""
+    largest = 0
+    for obj in pdf.objects:
+        if isinstance(obj, pikepdf.Stream) and obj.get("/Subtype") == pikepdf.Name.Image:
+            try:
+                largest = max(largest, int(obj.Width) * int(obj.Height) * 3)
+            except (AttributeError, TypeError, ValueError):
+                continue
+    return largest
+
+
+class MemoryBudget:
+    """
+    Async byte-counting semaphore
+
+    `async with budget.reserve(cost)` waits until `cost` bytes are free,
+    then holds them for the duration of the block.
+    """
+
+    def __init__(self, capacity: int, queue_timeout: float):
+        self.capacity = capacity
+        self.queue_timeout = queue_timeout
+        self.in_use = 0
+        self._condition: Optional[asyncio.Condition] = None
+
+    @property
+    def condition(self) -> asyncio.Condition:
+        # Created lazily so it binds to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @asynccontextmanager
+    async def reserve(self, cost: int):
+        if cost > self.capacity:
+            raise AdmissionRejected(
+                f"Request needs an estimated {cost // 2**20} MB, above the "
+                f"{self.capacity // 2**20} MB processing limit",
+                status_code=413
+            )
+
+        async with self.condition:
+            try:
+                await asyncio.wait_for(
+                    self.condition.wait_for(lambda: self.in_use + cost <= self.capacity),
+                    timeout=self.queue_timeout
+                )
+            except asyncio.TimeoutError:
+                raise AdmissionRejected(
+                    "Server is busy processing other large files, please retry",
+                    status_code=503
+                )
+            self.in_use += cost
+
+        logger.debug(f"Admitted {cost} bytes ({self.in_use}/{self.capacity} in use)")
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.in_use -= cost
+                self.condition.notify_all()
+
+
+memory_budget = MemoryBudget(MEMORY_BUDGET_BYTES, QUEUE_TIMEOUT_SECONDS)
@@ -4,15 +4,27 @@ Main application entry point with v1 manual redaction support
 """
 
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 import io
 import json
+import math
+import re
 from typing import List, Dict, Any
 import logging
 
-from redact import apply_redactions, validate_pdf
-from image_process import process_image_watermark_removal, is_valid_image, get_image_info
+from redact import apply_redactions_with_report, validate_pdf, find_watermark_candidates, hex_to_rgb
+from image_process import (
+    process_image_watermark_removal_with_report, summarize_inpaint_report, is_valid_image, get_image_info,
+    count_frames, MAX_FRAMES
+)
+from admission import (
+    AdmissionRejected, estimate_analyze_cost, estimate_image_cost, estimate_pdf_cost, memory_budget
+)
+import workers
+from workers import get_processing_pool, read_upload
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -25,6 +37,17 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# File extension and media type for each image output format
+OUTPUT_IMAGE_TYPES = {
+    'PNG': ('png', 'image/png'),
+    'TIFF': ('tiff', 'image/tiff'),
+    'GIF': ('gif', 'image/gif'),
+    'WEBP': ('webp', 'image/webp'),
+}
+
+# Overlay colors accepted for unblend actions
+HEX_COLOR = re.compile(r'#?[0-9A-Fa-f]{6}')
+
 # CORS configuration for Netlify frontend
 ALLOWED_ORIGINS = [
     "http://localhost:5173",  # Vite dev server
@@ -38,10 +61,54 @@ app.add_middleware(
     allow_credentials=False,
     allow_methods=["POST", "GET", "OPTIONS"],
     allow_headers=["*"],
-    expose_headers=["Content-Disposition"],
+    expose_headers=["Content-Disposition", "X-Optimization-Report", "X-Inpaint-Report"],
 )
 
 
+def _unblend_options(actions_list: List[Dict[str, Any]]):
+    """
+    Validate unblend actions for an image
+    
+    Unblend runs on the whole request with one overlay color and opacity,
+    so it cannot be mixed with other methods and every unblend action must
+    give the same color / alpha (either may be omitted to estimate it).
+    
+    Returns:
+        (unblend, overlay_color as 0-255 RGB or None, alpha or None)
+    
+    Raises:
+        HTTPException: 400 for mixed methods or invalid / differing values
+    """
+    methods = {action.get('method') == 'unblend' for action in actions_list}
+    if True not in methods:
+        return False, None, None
+    if False in methods:
+        raise HTTPException(
+            status_code=400,
+            detail="Unblend actions cannot be mixed with other methods in one request"
+        )
+    
+    colors = {json.dumps(action.get('color')) for action in actions_list}
+    alphas = {json.dumps(action.get('alpha')) for action in actions_list}
+    if len(colors) > 1 or len(alphas) > 1:
+        raise HTTPException(
+            status_code=400,
+            detail="All unblend actions must use the same color and alpha"
+        )
+    color, alpha = actions_list[0].get('color'), actions_list[0].get('alpha')
+    
+    if color is not None and not (isinstance(color, str) and HEX_COLOR.fullmatch(color)):
+        raise HTTPException(status_code=400, detail="color must be a hex color like #FFFFFF")
+    if alpha is not None and (
+        isinstance(alpha, bool) or not isinstance(alpha, (int, float))
+        or not math.isfinite(alpha) or not 0 <= alpha <= 1
+    ):
+        raise HTTPException(status_code=400, detail="alpha must be a number between 0 and 1")
+    
+    overlay_color = tuple(round(c * 255) for c in hex_to_rgb(color)) if color else None
+    return True, overlay_color, alpha
+
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -73,31 +140,32 @@ async def analyze_watermarks(file: UploadFile = File(...)):
     """
     v2 Feature: Auto-detect watermark candidates in PDF
     
-    Currently returns empty candidates (v1 only supports manual selection).
-    Will be implemented in v2 with text/logo/scan detection.
+    Indexes every page's drawn objects once and reports text runs, images
+    and XObjects repeated at the same position across pages (or rotated /
+    translucent on single-page documents).
     """
     try:
         # Read PDF file
         pdf_bytes = await file.read()
         
-        # Validate PDF
-        validation_result = validate_pdf(pdf_bytes)
+        # Validate PDF (parsing and costing decompress streams: off the event loop)
+        validation_result = await run_in_threadpool(validate_pdf, pdf_bytes)
         if not validation_result["valid"]:
             raise HTTPException(
                 status_code=400,
                 detail=validation_result["error"]
             )
         
-        # v1: Return empty candidates (manual selection only)
-        # v2: Will implement detection logic in analyzer.py
-        return {
-            "pages": validation_result.get("page_count", 0),
-            "candidates": [],
-            "message": "v1: Manual selection only. Auto-detection coming in v2."
-        }
+        cost = await run_in_threadpool(estimate_analyze_cost, pdf_bytes)
+        async with memory_budget.reserve(cost):
+            return await run_in_threadpool(find_watermark_candidates, pdf_bytes)
         
     except HTTPException:
         raise
+    except AdmissionRejected as e:
+        logger.warning(f"Admission rejected: {str(e)}")
+        headers = {"Retry-After": "5"} if e.status_code == 503 else None
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
     except Exception as e:
         logger.error(f"Analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
@@ -107,7 +175,10 @@ async def analyze_watermarks(file: UploadFile = File(...)):
 async def apply_watermark_removal(
     file: UploadFile = File(...),
     actions: str = Form(...),
-    re_ocr: str = Form("false")
+    re_ocr: str = Form("false"),
+    optimize: str = Form("false"),
+    target_dpi: str = Form(""),
+    time_budget_ms: str = Form("")
 ):
     """
     Apply watermark removal actions to PDF or Image
@@ -116,25 +187,41 @@ async def apply_watermark_removal(
         file: Original PDF or Image file
         actions: JSON string with removal actions
         re_ocr: Whether to re-OCR after inpainting (v3 feature)
+        optimize: Whether to shrink cleaned PDFs (dedupe streams/fonts, drop
+            unused resources); bytes saved are returned in the
+            X-Optimization-Report header
+        target_dpi: With optimize, downsample PDF images above this DPI
+        time_budget_ms: Inpainting time budget for images; the strategies
+            chosen (fill / telea / ns / pyramid) are summarized in the
+            X-Inpaint-Report header
     
     Returns:
         StreamingResponse with cleaned file
     """
+    # With PROCESS_WORKERS set, the upload goes into shared memory and is
+    # processed in a worker process without being copied or pickled
+    pool = get_processing_pool()
+    upload = None
+    result = None
     try:
         # Read file
-        file_bytes = await file.read()
+        if pool:
+            upload = await read_upload(file)
+            file_bytes = upload.view
+        else:
+            file_bytes = await file.read()
         content_type = file.content_type or ""
         
         # Determine file type
         is_pdf = content_type == "application/pdf" or file.filename.lower().endswith('.pdf')
         is_image = content_type.startswith("image/") or any(
             file.filename.lower().endswith(ext) 
-            for ext in ['.jpg', '.jpeg', '.png', '.webp']
+            for ext in ['.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff', '.gif']
         )
         
         if is_pdf:
             # Handle PDF
-            validation_result = validate_pdf(file_bytes)
+            validation_result = await run_in_threadpool(validate_pdf, file_bytes)
             if not validation_result["valid"]:
                 raise HTTPException(
                     status_code=400,
@@ -150,13 +237,30 @@ async def apply_watermark_removal(
             if not isinstance(actions_list, list):
                 raise HTTPException(status_code=400, detail="Actions must be an array")
             
-            # Apply PDF redactions
+            # Apply PDF redactions once the memory budget admits them
             logger.info(f"Processing PDF with {len(actions_list)} redaction actions")
-            cleaned_bytes = apply_redactions(
-                pdf_bytes=file_bytes,
+            try:
+                dpi = int(target_dpi) if target_dpi else None
+            except ValueError:
+                raise HTTPException(status_code=400, detail="target_dpi must be an integer")
+            
+            options = dict(
                 actions=actions_list,
-                re_ocr=(re_ocr.lower() == "true")
+                re_ocr=(re_ocr.lower() == "true"),
+                optimize=(optimize.lower() == "true"),
+                target_dpi=dpi
+            )
+            cost = await run_in_threadpool(
+                estimate_pdf_cost,
+                file_bytes, actions_list, target_dpi=dpi if options["optimize"] else None
             )
+            async with memory_budget.reserve(cost):
+                if pool:
+                    result, optimization_report = await pool.apply_redactions(upload, **options)
+                else:
+                    cleaned_bytes, optimization_report = await run_in_threadpool(
+                        apply_redactions_with_report, pdf_bytes=file_bytes, **options
+                    )
             
             # Generate filename
             original_name = file.filename or "document.pdf"
@@ -165,8 +269,14 @@ async def apply_watermark_removal(
             media_type = "application/pdf"
             
         elif is_image:
-            # Handle Image
-            if not is_valid_image(file_bytes):
+            # Handle Image: the frame count is read from headers; checking
+            # that every frame decodes (GIF seeks decode) runs off the event loop
+            if await run_in_threadpool(count_frames, file_bytes) > MAX_FRAMES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"Too many frames (at most {MAX_FRAMES} per file)"
+                )
+            if not await run_in_threadpool(is_valid_image, file_bytes):
                 raise HTTPException(
                     status_code=400,
                     detail="Invalid or corrupted image file"
@@ -185,46 +295,95 @@ async def apply_watermark_removal(
                     bbox = action['bbox']
                     if len(bbox) == 4:
                         regions.append(tuple(bbox))
-            
+
+            # Semi-transparent overlays: invert the blend instead of inpainting
+            unblend, overlay_color, alpha = _unblend_options(actions_list)
+
             # Process image
             logger.info(f"Processing image with {len(regions)} regions")
-            method = 'inpaint' if regions else 'auto'
-            cleaned_bytes, output_format = process_image_watermark_removal(
-                image_bytes=file_bytes,
+            if unblend:
+                method = 'unblend'
+            else:
+                method = 'inpaint' if regions else 'auto'
+            cost = await run_in_threadpool(estimate_image_cost, file_bytes, method, regions or None)
+            try:
+                budget = float(time_budget_ms) if time_budget_ms else None
+            except ValueError:
+                budget = -1.0
+            if budget is not None and not 0 <= budget < float("inf"):
+                raise HTTPException(status_code=400, detail="time_budget_ms must be a non-negative number")
+            
+            options = dict(
                 method=method,
                 regions=regions if regions else None,
-                auto_detect=(len(regions) == 0)
+                auto_detect=(len(regions) == 0 and not unblend),
+                overlay_color=overlay_color,
+                alpha=alpha,
+                time_budget_ms=budget
             )
+            async with memory_budget.reserve(cost):
+                if pool:
+                    result, output_format, inpaint_report = await pool.process_image(upload, **options)
+                else:
+                    cleaned_bytes, output_format, inpaint_report = await run_in_threadpool(
+                        process_image_watermark_removal_with_report, image_bytes=file_bytes, **options
+                    )
             
-            # Generate filename
-            original_name = file.filename or "image.png"
+            # Generate filename (multi-frame files keep their container)
+            extension, media_type = OUTPUT_IMAGE_TYPES[output_format]
+            original_name = file.filename or f"image.{extension}"
             base_name = original_name.rsplit('.', 1)[0]
-            cleaned_filename = f"{base_name}.cleaned.png"
-            media_type = "image/png"
+            cleaned_filename = f"{base_name}.cleaned.{extension}"
             
         else:
             raise HTTPException(
                 status_code=400,
-                detail="Unsupported file type. Please upload PDF, JPEG, PNG, or WebP."
+                detail="Unsupported file type. Please upload PDF, JPEG, PNG, WebP, TIFF, or GIF."
             )
         
+        headers = {
+            "Content-Disposition": f'attachment; filename="{cleaned_filename}"',
+            "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
+            "Pragma": "no-cache",
+            "Expires": "0"
+        }
+        if is_pdf:
+            if optimization_report:
+                headers["X-Optimization-Report"] = json.dumps(optimization_report)
+        elif inpaint_report:
+            headers["X-Inpaint-Report"] = json.dumps(summarize_inpaint_report(inpaint_report))
+        
         # Return as streaming response
+        if result is not None:
+            # Stream straight out of the worker's segment, then free it
+            response = StreamingResponse(
+                result.iter_chunks(),
+                media_type=media_type,
+                headers=headers,
+                background=BackgroundTask(result.release, unlink=True)
+            )
+            result = None
+            return response
         return StreamingResponse(
             io.BytesIO(cleaned_bytes),
             media_type=media_type,
-            headers={
-                "Content-Disposition": f'attachment; filename="{cleaned_filename}"',
-                "Cache-Control": "no-store, no-cache, must-revalidate, max-age=0",
-                "Pragma": "no-cache",
-                "Expires": "0"
-            }
+            headers=headers
         )
         
     except HTTPException:
         raise
+    except AdmissionRejected as e:
+        logger.warning(f"Admission rejected: {str(e)}")
+        headers = {"Retry-After": "5"} if e.status_code == 503 else None
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
     except Exception as e:
         logger.error(f"Processing error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Processing failed: {str(e)}")
+    finally:
+        if upload is not None:
+            upload.release(unlink=True)
+        if result is not None:
+            result.release(unlink=True)
 
 
 @app.post("/clear-session")
@@ -241,15 +400,26 @@ async def clear_session():
     }
 
 
+@app.on_event("shutdown")
+def shutdown_processing_pool():
+    """Stop worker processes (only started once a request has used them)"""
+    if workers._processing_pool:
+        workers._processing_pool.shutdown()
+
+
 # Error handlers
 @app.exception_handler(413)
 async def payload_too_large_handler(request, exc):
     """Handle file too large errors"""
-    return {
-        "error": "File too large",
-        "detail": "PDF exceeds maximum size limit (50MB)",
-        "status_code": 413
-    }
+    detail = getattr(exc, "detail", None) or "PDF exceeds maximum size limit (50MB)"
+    return JSONResponse(
+        status_code=413,
+        content={
+            "error": "File too large",
+            "detail": detail,
+            "status_code": 413
+        }
+    )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,99 @@
+"""
+Benchmark for the per-page spatial index on dense vector pages
+
+Compares, for N bbox queries against one page:
+  - rescan:  interpret the content stream again for every query
+  - linear:  interpret once, then test every object per query
+  - indexed: interpret once, then look up the grid per query
+
+Usage:
+    python bench_page_index.py --paths 20000 --texts 2000 --queries 200
+"""
+
+import argparse
+import io
+import random
+import time
+
+import pikepdf
+from pikepdf import Dictionary, Name
+
+from page_index import build_page_index, intersects
+
+
+def make_dense_page_pdf(paths: int, texts: int, seed: int = 0) -> bytes:
+    """One letter-size page of small stroked/filled paths and text runs"""
+    rng = random.Random(seed)
+    ops = []
+    for i in range(paths):
+        x, y = rng.uniform(0, 600), rng.uniform(0, 780)
+        if i % 3 == 0:
+            ops.append(f"{x:.2f} {y:.2f} {rng.uniform(1, 8):.2f} {rng.uniform(1, 8):.2f} re f")
+        else:
+            ops.append(f"{x:.2f} {y:.2f} m {x + rng.uniform(-6, 6):.2f} {y + rng.uniform(-6, 6):.2f} l S")
+    ops.append("BT /F1 6 Tf")
+    for i in range(texts):
+        ops.append(f"1 0 0 1 {rng.uniform(0, 560):.2f} {rng.uniform(0, 780):.2f} Tm (label {i}) Tj")
+    ops.append("ET")
+
+    pdf = pikepdf.new()
+    font = pdf.make_indirect(Dictionary(
+        Type=Name.Font, Subtype=Name.Type1, BaseFont=Name.Helvetica
+    ))
+    pdf.pages.append(pikepdf.Page(Dictionary(
+        Type=Name.Page,
+        MediaBox=[0, 0, 612, 792],
+        Contents=pdf.make_stream("\n".join(ops).encode()),
+        Resources=Dictionary(Font=Dictionary(F1=font)),
+    )))
+    output = io.BytesIO()
+    pdf.save(output)
+    return output.getvalue()
+
+
+def timed(func) -> float:
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the page spatial index")
+    parser.add_argument("--paths", type=int, default=20000, help="path objects on the page")
+    parser.add_argument("--texts", type=int, default=2000, help="text runs on the page")
+    parser.add_argument("--queries", type=int, default=200, help="bbox queries (actions)")
+    parser.add_argument("--rescan-queries", type=int, default=10,
+                        help="queries timed for the rescan baseline (extrapolated)")
+    args = parser.parse_args()
+
+    pdf = pikepdf.open(io.BytesIO(make_dense_page_pdf(args.paths, args.texts)))
+    page = pdf.pages[0]
+
+    rng = random.Random(1)
+    queries = []
+    for _ in range(args.queries):
+        x, y = rng.uniform(0, 550), rng.uniform(0, 730)
+        queries.append((x, y, x + rng.uniform(10, 60), y + rng.uniform(10, 60)))
+
+    build_time = timed(lambda: build_page_index(page))
+    index = build_page_index(page)
+    print(f"page: {len(index.operators)} operators, {len(index.objects)} objects, "
+          f"index build {build_time * 1000:.1f}ms")
+
+    sample = queries[:args.rescan_queries]
+    rescan = timed(lambda: [build_page_index(page).query(q) for q in sample])
+    rescan = rescan / len(sample) * len(queries)
+
+    linear = build_time + timed(lambda: [
+        [obj for obj in index.objects if intersects(obj.bbox, q)] for q in queries
+    ])
+    indexed = build_time + timed(lambda: [index.query(q) for q in queries])
+
+    print(f"{len(queries)} queries:")
+    print(f"  rescan   {rescan * 1000:10.1f}ms  (extrapolated from {len(sample)})")
+    print(f"  linear   {linear * 1000:10.1f}ms")
+    print(f"  indexed  {indexed * 1000:10.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Zero-copy buffer helpers
+
+BufferReader / open_buffer give PIL, pikepdf and OpenCV a file-like or
+array view over any bytes-like object (bytes, memoryview of shared
+memory, mmap) without duplicating it. SharedBuffer wraps a
+multiprocessing.shared_memory segment used to hand uploads to worker
+processes and results back to the API process.
+"""
+
+import gc
+import io
+import logging
+import traceback
+from multiprocessing import shared_memory
+from typing import BinaryIO, Iterator, Union
+
+logger = logging.getLogger(__name__)
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+# Chunk size for streaming uploads in and results out
+CHUNK_SIZE = 1024 * 1024
+
+
+class BufferReader(io.RawIOBase):
+    """Seekable, read-only file object over a buffer (no copy of the data)"""
+
+    def __init__(self, data: BytesLike):
+        super().__init__()
+        self._view = memoryview(data).cast('B')
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        n = max(0, min(len(b), len(self._view) - self._pos))
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            self._pos = offset
+        elif whence == io.SEEK_CUR:
+            self._pos += offset
+        else:
+            self._pos = len(self._view) + offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        self._view.release()
+        super().close()
+
+
+def open_buffer(data: BytesLike) -> BinaryIO:
+    """File object over bytes-like data; bytes use BytesIO, which shares them"""
+    if isinstance(data, bytes):
+        return io.BytesIO(data)
+    return BufferReader(data)
+
+
+class SharedBuffer:
+    """
+    A shared memory segment holding `size` bytes of payload
+
+    The creating side writes the payload and hands (name, size) to the
+    other process, which attaches and reads `view` in place. Whoever
+    finishes with it last calls release(unlink=True).
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, size: int):
+        self.shm = shm
+        self.size = size
+        self.view = shm.buf[:size]
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    @classmethod
+    def create(cls, size: int) -> "SharedBuffer":
+        # Zero-length segments are not allowed
+        return cls(shared_memory.SharedMemory(create=True, size=max(size, 1)), size)
+
+    @classmethod
+    def attach(cls, name: str, size: int) -> "SharedBuffer":
+        return cls(shared_memory.SharedMemory(name=name), size)
+
+    @classmethod
+    def from_bytes(cls, data: BytesLike) -> "SharedBuffer":
+        buffer = cls.create(len(data))
+        buffer.view[:] = data
+        return buffer
+
+    @classmethod
+    def from_file(cls, fp: BinaryIO, size: int) -> "SharedBuffer":
+        """Read exactly `size` bytes from fp straight into shared memory"""
+        buffer = cls.create(size)
+        pos = 0
+        try:
+            while pos < size:
+                n = fp.readinto(buffer.view[pos:min(pos + CHUNK_SIZE, size)])
+                if not n:
+                    break
+                pos += n
+        except BaseException:
+            buffer.release(unlink=True)
+            raise
+        if pos < size:
+            buffer.release(unlink=True)
+            raise ValueError(f"Upload truncated: read {pos} of {size} bytes")
+        return buffer
+
+    def iter_chunks(self) -> Iterator[bytes]:
+        """Stream the payload out in bounded chunks"""
+        for pos in range(0, self.size, CHUNK_SIZE):
+            yield bytes(self.view[pos:pos + CHUNK_SIZE])
+
+    def release(self, unlink: bool = False):
+        """
+        Drop this process's mapping (and the segment itself with unlink)
+
+        Raises BufferError if an ndarray / reader over the payload is still
+        alive after a garbage collection pass.
+        """
+        try:
+            self._close()
+        except BufferError:
+            # A view is only reachable from a reference cycle: collect it
+            gc.collect()
+            self._close()
+        if unlink:
+            self.shm.unlink()
+
+    def _close(self):
+        if self.view is not None:
+            self.view.release()
+            self.view = None
+        self.shm.close()
+
+    def __enter__(self) -> "SharedBuffer":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is None:
+            self.release()
+            return
+        # The failed call's frames (kept alive by the traceback) may still
+        # hold arrays or readers over the view; drop their locals so the
+        # mapping can close, and never let cleanup mask the real error
+        while exc is not None:
+            traceback.clear_frames(exc.__traceback__)
+            exc = exc.__cause__ or exc.__context__
+        try:
+            self.release()
+        except BufferError as e:
+            logger.warning(f"Shared buffer {self.name} still in use: {str(e)}")
@@ -1,72 +1,91 @@
 """
 Image watermark removal using OpenCV and PIL
-Supports: JPEG, PNG, WebP
+Supports: JPEG, PNG, WebP, plus multi-page TIFF and animated GIF/WebP/PNG
 """
 
+import math
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
 import cv2
 import numpy as np
-from PIL import Image
+from PIL import Image, ImageDraw, ImageSequence
 from io import BytesIO
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional, Union
 
+from buffers import open_buffer
 
-def remove_watermark_inpaint(
-    image_bytes: bytes,
-    mask_regions: Optional[List[Tuple[int, int, int, int]]] = None,
-    method: str = 'telea'
-) -> bytes:
-    """
-    Remove watermark using inpainting technique
-    
-    Args:
-        image_bytes: Input image as bytes
-        mask_regions: List of (x, y, width, height) regions to remove
-        method: 'telea' or 'ns' (Navier-Stokes)
+
+# Containers whose extra frames are processed and written back
+MULTI_FRAME_FORMATS = {'TIFF', 'GIF', 'WEBP', 'PNG'}
+# Containers whose Pillow writer holds every processed frame until the end
+BUFFERED_FRAME_FORMATS = {'GIF', 'WEBP', 'PNG'}
+# Most frames processed from one multi-frame file
+MAX_FRAMES = 1000
+# TIFF compressions written back as found (others, e.g. JPEG, become
+# deflate); CCITT fax compressions need every page to be bilevel
+TIFF_KEPT_COMPRESSIONS = {
+    'raw', 'packbits', 'tiff_lzw', 'tiff_deflate', 'tiff_adobe_deflate', 'group3', 'group4'
+}
+
+# Neighbourhood radius (pixels) for OpenCV inpainting
+INPAINT_RADIUS = 3
+
+# Default per-request time budget for adaptive inpainting (milliseconds)
+INPAINT_TIME_BUDGET_MS = float(os.environ.get("INPAINT_TIME_BUDGET_MS", "2000"))
+
+# Cost model for adaptive inpainting: seconds per masked pixel at
+# INPAINT_RADIUS, measured on cropped patches (Telea and NS both grow
+# linearly with the masked area and with the radius squared)
+STRATEGY_PIXEL_COST = {
+    'fill': 0.06e-6,
+    'telea': 1.5e-6,
+    'ns': 1.5e-6,
+}
+# Seconds per pixel to shrink or enlarge a pyramid crop
+RESIZE_PIXEL_COST = 0.005e-6
+
+# Surroundings this smooth once a gradient is removed (gray levels std) get a fill
+FLAT_RESIDUAL_STD = 3.0
+# Fraction of edge pixels around a region above which NS keeps structure better
+NS_EDGE_DENSITY = 0.08
+# Textured regions this large are inpainted at reduced scale, aiming at
+# PYRAMID_TARGET_PIXELS masked pixels after downscaling
+PYRAMID_MIN_PIXELS = 256 * 256
+PYRAMID_TARGET_PIXELS = 128 * 128
+PYRAMID_MAX_FACTOR = 8
+# Region entries kept in a summarized inpainting report (response header)
+INPAINT_REPORT_MAX_ENTRIES = 20
+
+# Rows converted to float32 at a time when unblending, and histogram bins
+# for the median overlay opacity
+UNBLEND_BAND_ROWS = 256
+OPACITY_BINS = 4096
+# Pixels sampled per region to estimate the overlay color, and the share
+# of them (farthest from the background) taken as fully covered
+OVERLAY_COLOR_SAMPLES = 256 * 256
+OVERLAY_COLOR_QUANTILE = 0.99
+
+
+def _threshold_watermark_mask(img: np.ndarray) -> np.ndarray:
+    """Mask of very light or very dark areas (regionless auto-detect)"""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
     
-    Returns:
-        Processed image as bytes
-    """
-    # Convert bytes to numpy array
-    nparr = np.frombuffer(image_bytes, np.uint8)
-    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    # Detect light watermarks (common case)
+    _, light_mask = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY)
     
-    if img is None:
-        raise ValueError("Failed to decode image")
+    # Detect dark watermarks
+    _, dark_mask = cv2.threshold(gray, 15, 255, cv2.THRESH_BINARY_INV)
     
-    # Create mask
-    mask = np.zeros(img.shape[:2], dtype=np.uint8)
+    # Combine masks
+    mask = cv2.bitwise_or(light_mask, dark_mask)
     
-    if mask_regions:
-        # Manual regions specified
-        for x, y, w, h in mask_regions:
-            cv2.rectangle(mask, (x, y), (x + w, y + h), 255, -1)
-    else:
-        # Auto-detect watermark (simple approach: detect very light or very dark areas)
-        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-        
-        # Detect light watermarks (common case)
-        _, light_mask = cv2.threshold(gray, 240, 255, cv2.THRESH_BINARY)
-        
-        # Detect dark watermarks
-        _, dark_mask = cv2.threshold(gray, 15, 255, cv2.THRESH_BINARY_INV)
-        
-        # Combine masks
-        mask = cv2.bitwise_or(light_mask, dark_mask)
-        
-        # Clean up noise
-        kernel = np.ones((5, 5), np.uint8)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
-    
-    # Apply inpainting
-    if method == 'ns':
-        result = cv2.inpaint(img, mask, 3, cv2.INPAINT_NS)
-    else:  # telea (faster, better for small regions)
-        result = cv2.inpaint(img, mask, 3, cv2.INPAINT_TELEA)
-    
-    # Convert back to bytes
-    _, buffer = cv2.imencode('.png', result)
-    return buffer.tobytes()
+    # Clean up noise
+    kernel = np.ones((5, 5), np.uint8)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
+    return cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
 
 
 def remove_watermark_simple(
@@ -86,36 +105,539 @@ def remove_watermark_simple(
         Processed image as bytes
     """
     # Open image with PIL
-    img = Image.open(BytesIO(image_bytes))
+    img = Image.open(open_buffer(image_bytes))
     
     # Convert to RGB if needed
     if img.mode != 'RGB':
         img = img.convert('RGB')
     
-    # Convert to numpy for OpenCV processing
-    img_array = np.array(img)
-    img_cv = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-    
-    # Fill each region
+    # Fill each region in place (corners inclusive, clipped to the image)
+    draw = ImageDraw.Draw(img)
     for x, y, w, h in regions:
-        cv2.rectangle(
-            img_cv, 
-            (x, y), 
-            (x + w, y + h), 
-            fill_color[::-1],  # BGR format
-            -1  # Fill
-        )
-    
-    # Convert back to PIL and save
-    result_rgb = cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB)
-    result_img = Image.fromarray(result_rgb)
+        draw.rectangle([x, y, x + w, y + h], fill=tuple(fill_color))
     
     # Save to bytes
     output = BytesIO()
-    result_img.save(output, format='PNG', optimize=True)
+    img.save(output, format='PNG', optimize=True)
     return output.getvalue()
 
 
+def remove_watermark_unblend(
+    image_bytes: bytes,
+    regions: Optional[List[Tuple[int, int, int, int]]] = None,
+    overlay_color: Optional[Tuple[int, int, int]] = None,
+    alpha: Optional[Union[float, np.ndarray]] = None
+) -> bytes:
+    """
+    Remove a semi-transparent overlay by inverting the alpha blend
+
+    A blended watermark pixel is I = alpha * W + (1 - alpha) * J, so the
+    original pixel is recovered as J = (I - alpha * W) / (1 - alpha).
+    Unlike inpainting, the detail underneath the overlay is kept.
+
+    Args:
+        image_bytes: Input image as bytes
+        regions: List of (x, y, width, height) regions containing the
+            overlay (default: whole image)
+        overlay_color: RGB color of the overlay (estimated per region if
+            omitted, see _estimate_overlay_color)
+        alpha: Overlay opacity, either a scalar or a full-size (H, W) alpha
+            map in 0.0 - 1.0 (estimated per region if omitted). A scalar
+            only applies to pixels the overlay covers, like the estimate.
+
+    Returns:
+        Processed image as bytes
+    """
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+    if img is None:
+        raise ValueError("Failed to decode image")
+
+    img_h, img_w = img.shape[:2]
+
+    alpha_map = None
+    if alpha is not None and np.ndim(alpha) > 0:
+        alpha_map = np.asarray(alpha, dtype=np.float32)
+        if alpha_map.shape != (img_h, img_w):
+            raise ValueError(
+                f"Alpha map shape {alpha_map.shape} does not match image "
+                f"size {(img_h, img_w)}"
+            )
+
+    if not regions:
+        regions = [(0, 0, img_w, img_h)]
+
+    # Regions are inverted in place a band of rows at a time, so the
+    # float32 working set stays small whatever the image size
+    for x, y, w, h in regions:
+        # Clip region to image bounds
+        x0, y0 = max(int(x), 0), max(int(y), 0)
+        x1, y1 = min(int(x + w), img_w), min(int(y + h), img_h)
+        if x1 <= x0 or y1 <= y0:
+            continue
+
+        patch = img[y0:y1, x0:x1]
+
+        # Background color: median of a ring around the region, or of the
+        # region itself when it covers the whole image
+        background = _estimate_background(img, x0, y0, x1, y1).astype(np.float32)
+
+        scalar_alpha = float(alpha) if alpha is not None and alpha_map is None else None
+        if overlay_color is not None:
+            color = np.array(overlay_color[::-1], dtype=np.float32)  # BGR
+        else:
+            color = _estimate_overlay_color(patch, background, scalar_alpha)
+
+        if alpha_map is None:
+            opacity = scalar_alpha
+            if opacity is None:
+                opacity = _estimate_opacity(patch, background, color)
+
+        for start in range(0, y1 - y0, UNBLEND_BAND_ROWS):
+            rows = slice(start, start + UNBLEND_BAND_ROWS)
+            band = patch[rows].astype(np.float32)
+
+            if alpha_map is not None:
+                band_alpha = alpha_map[y0:y1, x0:x1][rows]
+            else:
+                band_alpha = _overlay_alpha(band, background, color, opacity)
+
+            # Never divide by (1 - alpha) near zero
+            band_alpha = np.clip(band_alpha, 0.0, 0.95)
+            if np.ndim(band_alpha):
+                band_alpha = band_alpha[..., None]
+
+            band -= band_alpha * color
+            band /= 1.0 - band_alpha
+            np.clip(band, 0, 255, out=band)
+            patch[rows] = band
+
+    _, buffer = cv2.imencode('.png', img)
+    return buffer.tobytes()
+
+
+def _estimate_background(
+    img: np.ndarray,
+    x0: int, y0: int, x1: int, y1: int,
+    border: int = 8
+) -> np.ndarray:
+    """Median BGR color of the pixels surrounding a region"""
+    img_h, img_w = img.shape[:2]
+    bx0, by0 = max(x0 - border, 0), max(y0 - border, 0)
+    bx1, by1 = min(x1 + border, img_w), min(y1 + border, img_h)
+
+    ring = np.ones((by1 - by0, bx1 - bx0), dtype=bool)
+    ring[y0 - by0:y1 - by0, x0 - bx0:x1 - bx0] = False
+
+    if ring.any():
+        return np.median(img[by0:by1, bx0:bx1][ring], axis=0)
+    return np.median(img[y0:y1, x0:x1].reshape(-1, 3), axis=0)
+
+
+def _estimate_overlay_color(
+    patch: np.ndarray,
+    background: np.ndarray,
+    alpha: Optional[float] = None
+) -> np.ndarray:
+    """
+    Estimate the BGR overlay color of a patch
+
+    The sampled pixels farthest from the background are taken as covered
+    by the overlay; their median lies between the background and the
+    overlay color. With a known alpha the overlay color is solved for.
+    Without one, opacity and color cannot be told apart, so the overlay is
+    taken as the most saturated color in that direction (the edge of the
+    color cube: white or black for neutral overlays). A pale or gray
+    overlay then comes out more saturated and more transparent than it
+    is, which inverts to about the same result.
+    """
+    step = max(1, math.ceil(math.sqrt(patch.shape[0] * patch.shape[1] / OVERLAY_COLOR_SAMPLES)))
+    sample = patch[::step, ::step].reshape(-1, 3).astype(np.float32)
+    distance = np.linalg.norm(sample - background, axis=1)
+    if not len(distance) or distance.max() < 1.0:
+        # Indistinguishable from the background: nothing to invert
+        return background.astype(np.float32)
+
+    covered = sample[distance >= np.quantile(distance, OVERLAY_COLOR_QUANTILE)]
+    direction = np.median(covered, axis=0) - background
+    if alpha is not None and alpha > 0:
+        return np.clip(background + direction / alpha, 0, 255).astype(np.float32)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        reach = np.where(direction > 0, (255.0 - background) / direction,
+                         np.where(direction < 0, -background / direction, np.inf))
+    return np.clip(background + direction * float(reach.min()), 0, 255).astype(np.float32)
+
+
+def _project_opacity(
+    pixels: np.ndarray,
+    background: np.ndarray,
+    color: np.ndarray
+) -> Optional[np.ndarray]:
+    """
+    Per-pixel opacity: where each pixel sits on the background -> overlay
+    color axis (None when the two colors match and nothing can be inverted)
+    """
+    axis = color - background
+    norm = float(np.dot(axis, axis))
+    if norm < 1.0:
+        return None
+    return np.clip((pixels.astype(np.float32) - background) @ axis / norm, 0.0, 1.0)
+
+
+def _estimate_opacity(
+    patch: np.ndarray,
+    background: np.ndarray,
+    color: np.ndarray
+) -> float:
+    """
+    Estimate the uniform opacity of the overlay in a patch
+
+    The overlay is assumed to have one opacity (the median per-pixel
+    opacity over the pixels it covers) so texture underneath survives.
+    The median comes from a histogram filled band by band, so no full-size
+    float map is ever held.
+    """
+    counts = np.zeros(OPACITY_BINS, dtype=np.int64)
+    for start in range(0, patch.shape[0], UNBLEND_BAND_ROWS):
+        per_pixel = _project_opacity(patch[start:start + UNBLEND_BAND_ROWS], background, color)
+        if per_pixel is None:
+            return 0.0
+        covered = per_pixel[per_pixel > 0.05]
+        bins = np.minimum((covered * OPACITY_BINS).astype(np.int64), OPACITY_BINS - 1)
+        counts += np.bincount(bins, minlength=OPACITY_BINS)
+
+    total = int(counts.sum())
+    if not total:
+        return 0.0
+    median_bin = int(np.searchsorted(np.cumsum(counts), (total + 1) / 2))
+    return (median_bin + 0.5) / OPACITY_BINS
+
+
+def _overlay_alpha(
+    band: np.ndarray,
+    background: np.ndarray,
+    color: np.ndarray,
+    opacity: float
+) -> Union[np.ndarray, float]:
+    """Alpha map of a band: `opacity` where the overlay covers it, else 0"""
+    per_pixel = _project_opacity(band, background, color) if opacity > 0 else None
+    if per_pixel is None:
+        return 0.0
+    return np.where(per_pixel > opacity / 2, opacity, 0.0).astype(np.float32)
+
+
+def remove_watermark_adaptive(
+    image_bytes: bytes,
+    regions: Optional[List[Tuple[int, int, int, int]]] = None,
+    time_budget_ms: Optional[float] = None
+) -> Tuple[bytes, List[Dict]]:
+    """
+    Inpaint each region with a strategy chosen from its size and surroundings
+    
+    Strategies, cheapest first:
+        fill    - smooth fill blended in from the region's borders, for flat
+                  or gradient backgrounds
+        pyramid - Telea on a downscaled crop, scaled back up, for large
+                  textured regions
+        telea   - OpenCV Telea on a crop around the region
+        ns      - OpenCV Navier-Stokes, for surroundings full of edges
+    
+    Each region gets a share of the time budget proportional to the cost
+    of its preferred strategy. When that strategy is estimated to overrun
+    the share, it is downgraded to a coarser pyramid and finally to fill.
+    The cost model is rescaled with the measured time of each region as the
+    request goes, and time left over by one region carries to the next.
+    
+    Args:
+        image_bytes: Input image as bytes
+        regions: List of (x, y, width, height) regions to remove (default:
+            light/dark threshold mask, inpainted with Telea)
+        time_budget_ms: Inpainting time budget for the whole image
+            (default: INPAINT_TIME_BUDGET_MS)
+    
+    Returns:
+        (processed_image_bytes, report) with one entry per region:
+        bbox, strategy, preferred, scale, estimated_ms, elapsed_ms
+    """
+    nparr = np.frombuffer(image_bytes, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    
+    if img is None:
+        raise ValueError("Failed to decode image")
+    
+    if not regions:
+        return _inpaint_threshold_mask(img)
+    
+    if time_budget_ms is None:
+        time_budget_ms = INPAINT_TIME_BUDGET_MS
+    budget = max(time_budget_ms, 0.0) / 1000.0
+    img_h, img_w = img.shape[:2]
+    
+    # Every region is unknown up front, so none is filled from the pixels
+    # of a watermark still waiting its turn
+    rects = []
+    mask = np.zeros((img_h, img_w), dtype=np.uint8)
+    for x, y, w, h in regions:
+        x0, y0 = max(int(x), 0), max(int(y), 0)
+        x1, y1 = min(int(x + w), img_w), min(int(y + h), img_h)
+        rects.append((x0, y0, x1, y1))
+        if x1 > x0 and y1 > y0:
+            mask[y0:y1, x0:x1] = 255
+    
+    # Classify every region first so the budget can be shared out in
+    # proportion to what each one would cost at its best
+    start = time.perf_counter()
+    plan = []
+    for x0, y0, x1, y1 in rects:
+        if x1 <= x0 or y1 <= y0:
+            plan.append((None, 0.0))
+            continue
+        preferred = _preferred_strategy(img, mask, x0, y0, x1, y1)
+        # Unlimited time always fits the preferred strategy itself
+        plan.append((preferred, _fit_strategy(preferred, (x1 - x0) * (y1 - y0), math.inf)[2]))
+    budget -= time.perf_counter() - start
+    cost_left = sum(cost for _, cost in plan)
+    
+    speed = 1.0  # measured / modelled time so far
+    report = []
+    for (x0, y0, x1, y1), (preferred, preferred_cost) in zip(rects, plan):
+        if preferred is None:
+            # Entirely outside the image
+            report.append({
+                'bbox': [x0, y0, 0, 0], 'strategy': None, 'preferred': None,
+                'scale': 1, 'estimated_ms': 0.0, 'elapsed_ms': 0.0
+            })
+            continue
+        
+        share = max(budget, 0.0) * preferred_cost / cost_left if cost_left > 0 else 0.0
+        cost_left -= preferred_cost
+        strategy, scale, cost = _fit_strategy(preferred, (x1 - x0) * (y1 - y0), share / speed)
+        
+        start = time.perf_counter()
+        _run_strategy(img, mask, x0, y0, x1, y1, strategy, scale)
+        elapsed = time.perf_counter() - start
+        
+        # Filled pixels become known for the regions after this one
+        mask[y0:y1, x0:x1] = 0
+        budget -= elapsed
+        
+        report.append({
+            'bbox': [x0, y0, x1 - x0, y1 - y0],
+            'strategy': strategy,
+            'preferred': preferred,
+            'scale': scale,
+            'estimated_ms': round(cost * speed * 1000, 2),
+            'elapsed_ms': round(elapsed * 1000, 2)
+        })
+        if cost >= 0.001:
+            # Too short to time reliably below a millisecond
+            speed = 0.5 * speed + 0.5 * elapsed / cost
+    
+    _, buffer = cv2.imencode('.png', img)
+    return buffer.tobytes(), report
+
+
+def _inpaint_threshold_mask(img: np.ndarray) -> Tuple[bytes, List[Dict]]:
+    """Regionless fallback: Telea over the light/dark threshold mask"""
+    start = time.perf_counter()
+    mask = _threshold_watermark_mask(img)
+    
+    report = []
+    masked = int(np.count_nonzero(mask))
+    if masked:
+        img = cv2.inpaint(img, mask, INPAINT_RADIUS, cv2.INPAINT_TELEA)
+        report.append({
+            'bbox': list(cv2.boundingRect(mask)),
+            'strategy': 'telea',
+            'preferred': 'telea',
+            'scale': 1,
+            'estimated_ms': round(STRATEGY_PIXEL_COST['telea'] * masked * 1000, 2),
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 2)
+        })
+    
+    _, buffer = cv2.imencode('.png', img)
+    return buffer.tobytes(), report
+
+
+def _preferred_strategy(
+    img: np.ndarray,
+    mask: np.ndarray,
+    x0: int, y0: int, x1: int, y1: int,
+    border: int = 8,
+    gap: int = 2
+) -> str:
+    """
+    Best-looking strategy for a region, ignoring cost
+    
+    Looks at the known pixels in a ring around the region, skipping the
+    `gap` pixels next to it where the watermark's own edge shows up.
+    """
+    img_h, img_w = img.shape[:2]
+    pixels = (x1 - x0) * (y1 - y0)
+    large = pixels >= PYRAMID_MIN_PIXELS
+    
+    bx0, by0 = max(x0 - border, 0), max(y0 - border, 0)
+    bx1, by1 = min(x1 + border, img_w), min(y1 + border, img_h)
+    
+    ring = mask[by0:by1, bx0:bx1] == 0
+    ring[max(y0 - gap - by0, 0):y1 + gap - by0, max(x0 - gap - bx0, 0):x1 + gap - bx0] = False
+    if np.count_nonzero(ring) < 16:
+        # Nothing to judge the background by
+        return 'pyramid' if large else 'telea'
+    
+    gray = cv2.cvtColor(img[by0:by1, bx0:bx1], cv2.COLOR_BGR2GRAY)
+    ys, xs = np.nonzero(ring)
+    values = gray[ys, xs].astype(np.float32)
+    
+    # Remove a linear gradient; whatever is left over is texture
+    design = np.column_stack([xs, ys, np.ones_like(xs)]).astype(np.float32)
+    coeffs, *_ = np.linalg.lstsq(design, values, rcond=None)
+    if float(np.std(values - design @ coeffs)) < FLAT_RESIDUAL_STD:
+        return 'fill'
+    
+    if large:
+        return 'pyramid'
+    
+    edges = cv2.Canny(gray, 50, 150)
+    density = np.count_nonzero(edges[ring]) / len(values)
+    return 'ns' if density >= NS_EDGE_DENSITY else 'telea'
+
+
+def _strategy_cost(strategy: str, pixels: int, scale: int = 1) -> float:
+    """Modelled seconds to inpaint `pixels` masked pixels"""
+    if strategy == 'pyramid':
+        return (STRATEGY_PIXEL_COST['telea'] * pixels / scale ** 2
+                + 2 * RESIZE_PIXEL_COST * pixels)
+    return STRATEGY_PIXEL_COST[strategy] * pixels
+
+
+def _fit_strategy(preferred: str, pixels: int, allowed: float) -> Tuple[str, int, float]:
+    """
+    Cheapest acceptable downgrade of `preferred` that fits `allowed` seconds
+    
+    Returns:
+        (strategy, pyramid scale (1 unless pyramid), modelled seconds)
+    """
+    if preferred in ('telea', 'ns'):
+        cost = _strategy_cost(preferred, pixels)
+        if cost <= allowed:
+            return preferred, 1, cost
+    
+    if preferred != 'fill':
+        # Smallest downscale factor that fits, and never less than what a
+        # large region needs anyway (up to PYRAMID_MAX_FACTOR)
+        scale = 2
+        if preferred == 'pyramid':
+            scale = max(scale, math.ceil(math.sqrt(pixels / PYRAMID_TARGET_PIXELS)))
+            scale = min(scale, PYRAMID_MAX_FACTOR)
+        spare = allowed - 2 * RESIZE_PIXEL_COST * pixels
+        if spare > 0:
+            needed = math.sqrt(STRATEGY_PIXEL_COST['telea'] * pixels / spare)
+            scale = max(scale, math.ceil(needed))
+            if scale <= PYRAMID_MAX_FACTOR:
+                return 'pyramid', scale, _strategy_cost('pyramid', pixels, scale)
+    
+    # Not even the coarsest pyramid fits
+    return 'fill', 1, _strategy_cost('fill', pixels)
+
+
+def _run_strategy(
+    img: np.ndarray,
+    mask: np.ndarray,
+    x0: int, y0: int, x1: int, y1: int,
+    strategy: str,
+    scale: int
+):
+    """Inpaint one region of img in place"""
+    if strategy == 'fill':
+        img[y0:y1, x0:x1] = _border_fill(img, mask, x0, y0, x1, y1)
+        return
+    
+    # OpenCV only reads pixels within the radius of the mask, so a crop
+    # with a small margin gives the same result as the whole image
+    img_h, img_w = img.shape[:2]
+    margin = (2 * INPAINT_RADIUS + 1) * scale
+    cx0, cy0 = max(x0 - margin, 0), max(y0 - margin, 0)
+    cx1, cy1 = min(x1 + margin, img_w), min(y1 + margin, img_h)
+    crop = img[cy0:cy1, cx0:cx1]
+    crop_mask = mask[cy0:cy1, cx0:cx1]
+    
+    if strategy == 'pyramid':
+        size = (max((cx1 - cx0) // scale, 1), max((cy1 - cy0) // scale, 1))
+        small = cv2.resize(crop, size, interpolation=cv2.INTER_AREA)
+        # Partly masked pixels are unknown too
+        small_mask = cv2.resize(crop_mask, size, interpolation=cv2.INTER_AREA)
+        small_mask[small_mask > 0] = 255
+        filled = cv2.inpaint(small, small_mask, INPAINT_RADIUS, cv2.INPAINT_TELEA)
+        filled = cv2.resize(filled, (cx1 - cx0, cy1 - cy0), interpolation=cv2.INTER_LINEAR)
+    else:
+        flag = cv2.INPAINT_NS if strategy == 'ns' else cv2.INPAINT_TELEA
+        filled = cv2.inpaint(crop, crop_mask, INPAINT_RADIUS, flag)
+    
+    img[y0:y1, x0:x1] = filled[y0 - cy0:y1 - cy0, x0 - cx0:x1 - cx0]
+
+
+def _border_fill(
+    img: np.ndarray,
+    mask: np.ndarray,
+    x0: int, y0: int, x1: int, y1: int,
+    strip: int = 3
+) -> np.ndarray:
+    """
+    Fill a region by blending its four borders inward (a Coons patch)
+    
+    Each border is the median of a `strip`-pixel band outside the region,
+    so gradients carry through and noise does not. Borders at the image
+    edge or mostly covered by other regions are left out.
+    """
+    def border(y_slice, x_slice, axis):
+        band_mask = mask[y_slice, x_slice]
+        if band_mask.size == 0 or np.count_nonzero(band_mask) * 2 > band_mask.size:
+            return None
+        return np.median(img[y_slice, x_slice].astype(np.float32), axis=axis)
+    
+    top = border(slice(max(y0 - strip, 0), y0), slice(x0, x1), 0)
+    bottom = border(slice(y1, y1 + strip), slice(x0, x1), 0)
+    left = border(slice(y0, y1), slice(max(x0 - strip, 0), x0), 1)
+    right = border(slice(y0, y1), slice(x1, x1 + strip), 1)
+    
+    top = bottom if top is None else top
+    bottom = top if bottom is None else bottom
+    left = right if left is None else left
+    right = left if right is None else right
+    
+    h, w = y1 - y0, x1 - x0
+    u = ((np.arange(w, dtype=np.float32) + 1) / (w + 1))[None, :, None]
+    v = ((np.arange(h, dtype=np.float32) + 1) / (h + 1))[:, None, None]
+    
+    if top is None and left is None:
+        # Nothing known around the region at all
+        return np.median(img[y0:y1, x0:x1].reshape(-1, 3), axis=0)
+    
+    # float32 and in-place arithmetic: large regions are filled in a few
+    # passes over the patch
+    patch = np.zeros((h, w, 3), dtype=np.float32)
+    if top is not None:
+        patch += v * (bottom - top)[None]
+        patch += top[None]
+    if left is not None:
+        patch += u * (right - left)[:, None]
+        patch += left[:, None]
+    if top is not None and left is not None:
+        # Both blends include the corners; take one bilinear copy back out
+        c00, c10 = (top[0] + left[0]) / 2, (top[-1] + right[0]) / 2
+        c01, c11 = (bottom[0] + left[-1]) / 2, (bottom[-1] + right[-1]) / 2
+        patch -= c00
+        patch -= u * (c10 - c00)
+        patch -= v * (c01 - c00)
+        patch -= (u * v) * (c11 - c10 - c01 + c00)
+    
+    np.clip(patch, 0, 255, out=patch)
+    return patch.astype(np.uint8)
+
+
 def auto_detect_watermark_regions(
     image_bytes: bytes,
     sensitivity: float = 0.8
@@ -167,49 +689,321 @@ def process_image_watermark_removal(
     image_bytes: bytes,
     method: str = 'inpaint',
     regions: Optional[List[Tuple[int, int, int, int]]] = None,
-    auto_detect: bool = False
+    auto_detect: bool = False,
+    overlay_color: Optional[Tuple[int, int, int]] = None,
+    alpha: Optional[Union[float, np.ndarray]] = None,
+    time_budget_ms: Optional[float] = None
 ) -> Tuple[bytes, str]:
+    """Main function to remove watermarks from images (see process_image_watermark_removal_with_report)"""
+    result, output_format, _ = process_image_watermark_removal_with_report(
+        image_bytes, method, regions, auto_detect, overlay_color, alpha, time_budget_ms
+    )
+    return result, output_format
+
+
+def process_image_watermark_removal_with_report(
+    image_bytes: bytes,
+    method: str = 'inpaint',
+    regions: Optional[List[Tuple[int, int, int, int]]] = None,
+    auto_detect: bool = False,
+    overlay_color: Optional[Tuple[int, int, int]] = None,
+    alpha: Optional[Union[float, np.ndarray]] = None,
+    time_budget_ms: Optional[float] = None
+) -> Tuple[bytes, str, List[Dict]]:
     """
     Main function to remove watermarks from images
     
     Args:
         image_bytes: Input image as bytes
-        method: 'inpaint', 'cover', or 'auto'
+        method: 'inpaint', 'cover', 'unblend', or 'auto'
         regions: Manual regions to remove (x, y, width, height)
         auto_detect: Automatically detect watermark regions
+        overlay_color: RGB overlay color for 'unblend' (estimated if omitted)
+        alpha: Overlay opacity or (H, W) alpha map for 'unblend'
+        time_budget_ms: Inpainting time budget for the whole request
+            (default: INPAINT_TIME_BUDGET_MS)
     
     Returns:
-        (processed_image_bytes, output_format)
+        (processed_image_bytes, output_format, inpainting strategy chosen
+        for each region (see remove_watermark_adaptive); entries carry a
+        'frame' index for multi-frame files, empty for cover / unblend)
     """
     try:
+        if count_frames(image_bytes) > 1:
+            return _process_frames(
+                image_bytes, method, regions, auto_detect, overlay_color, alpha,
+                time_budget_ms
+            )
+        
         if auto_detect and not regions:
             regions = auto_detect_watermark_regions(image_bytes)
         
-        if method == 'inpaint':
-            result = remove_watermark_inpaint(image_bytes, regions)
-            return result, 'PNG'
-        
-        elif method == 'cover':
-            if not regions:
-                raise ValueError("Regions required for cover method")
-            result = remove_watermark_simple(image_bytes, regions)
-            return result, 'PNG'
-        
-        else:  # auto
-            # Try inpainting first
-            result = remove_watermark_inpaint(image_bytes, regions, method='telea')
-            return result, 'PNG'
+        result, report = _remove_watermark(
+            image_bytes, method, regions, overlay_color, alpha, time_budget_ms
+        )
+        return result, 'PNG', report
     
     except Exception as e:
         raise ValueError(f"Image processing failed: {str(e)}")
 
 
+def summarize_inpaint_report(
+    report: List[Dict],
+    max_entries: int = INPAINT_REPORT_MAX_ENTRIES
+) -> Dict:
+    """
+    Bounded summary of an inpainting report, small enough for a header
+    
+    Args:
+        report: Per-region entries from process_image_watermark_removal_with_report
+        max_entries: Region entries to keep, in processing order
+    
+    Returns:
+        dict with regions (count), strategies (count per strategy),
+        downgraded (regions not given their preferred strategy), elapsed_ms,
+        entries (the first max_entries entries) and truncated
+    """
+    strategies = {}
+    for entry in report:
+        if entry['strategy'] is not None:
+            strategies[entry['strategy']] = strategies.get(entry['strategy'], 0) + 1
+    
+    return {
+        'regions': len(report),
+        'strategies': strategies,
+        'downgraded': sum(1 for entry in report if entry['strategy'] != entry['preferred']),
+        'elapsed_ms': round(sum(entry['elapsed_ms'] for entry in report), 2),
+        'entries': report[:max_entries],
+        'truncated': len(report) > max_entries
+    }
+
+
+def _remove_watermark(
+    image_bytes: bytes,
+    method: str,
+    regions: Optional[List[Tuple[int, int, int, int]]],
+    overlay_color: Optional[Tuple[int, int, int]],
+    alpha: Optional[Union[float, np.ndarray]],
+    time_budget_ms: Optional[float] = None
+) -> Tuple[bytes, List[Dict]]:
+    """Run the selected removal method on a single frame (PNG bytes and inpainting report out)"""
+    if method == 'cover':
+        if not regions:
+            raise ValueError("Regions required for cover method")
+        return remove_watermark_simple(image_bytes, regions), []
+    
+    elif method == 'unblend':
+        return remove_watermark_unblend(image_bytes, regions, overlay_color, alpha), []
+    
+    else:  # inpaint / auto: strategy picked per region
+        return remove_watermark_adaptive(image_bytes, regions, time_budget_ms)
+
+
+def _process_frames(
+    image_bytes: bytes,
+    method: str,
+    regions: Optional[List[Tuple[int, int, int, int]]],
+    auto_detect: bool,
+    overlay_color: Optional[Tuple[int, int, int]],
+    alpha: Optional[Union[float, np.ndarray]],
+    time_budget_ms: Optional[float] = None,
+    max_workers: Optional[int] = None
+) -> Tuple[bytes, str, List[Dict]]:
+    """
+    Remove watermarks from every frame of a multi-page / animated image
+    
+    Frames are decoded one at a time and processed on a thread pool (OpenCV
+    releases the GIL), with at most 2 * max_workers frames in flight, then
+    re-encoded into the original container. The inpainting time budget is
+    shared out so that all frames together take about the request budget.
+    
+    Frames are processed as RGB; each is converted back to its source
+    mode when that is bilevel or grayscale, and keeps its transparency.
+    TIFF keeps the source compression and resolution.
+    
+    Only TIFF is written as frames arrive. The GIF, WebP and APNG writers
+    keep every processed frame until the file is complete, so memory grows
+    with the frame count for those; files are limited to MAX_FRAMES frames
+    and admission control accounts for the buffered frames.
+    
+    Returns:
+        (processed_image_bytes, output_format, inpainting report)
+    """
+    img = Image.open(open_buffer(image_bytes))
+    container = img.format
+    source_info = dict(img.info)  # first frame's; seeking replaces img.info
+    n_frames = img.n_frames
+    if n_frames > MAX_FRAMES:
+        raise ValueError(f"File has {n_frames} frames; at most {MAX_FRAMES} are supported")
+    
+    # Per-frame timing, modes and transparency have to be known before
+    # the encoder starts
+    if container == 'WEBP':
+        # Pillow only reports WebP timing once a frame is decoded
+        durations = _webp_durations(image_bytes)
+        modes, transparent = [], False
+    else:
+        durations, modes, transparent = [], [], False
+        for frame in ImageSequence.Iterator(img):
+            durations.append(frame.info.get('duration', 100))
+            modes.append(frame.mode)
+            transparent = transparent or _has_alpha(frame)
+    loop = source_info.get('loop', 0)
+    
+    max_workers = max_workers or os.cpu_count() or 1
+    
+    # Frames run max_workers at a time, so each may spend that many shares
+    if time_budget_ms is None:
+        time_budget_ms = INPAINT_TIME_BUDGET_MS
+    frame_budget_ms = time_budget_ms * min(max_workers, n_frames) / n_frames
+    report: List[Dict] = []
+    
+    # Auto-detected regions are reused for every frame of the same size
+    regions_by_size: Dict[Tuple[int, int], Optional[List[Tuple[int, int, int, int]]]] = {}
+    
+    def frame_regions(frame_bytes: bytes, size: Tuple[int, int]):
+        if regions or not auto_detect:
+            return regions
+        if size not in regions_by_size:
+            regions_by_size[size] = auto_detect_watermark_regions(frame_bytes)
+        return regions_by_size[size]
+    
+    def finish(future, index, mode, alpha):
+        frame_bytes, frame_report = future.result()
+        report.extend(dict(entry, frame=index) for entry in frame_report)
+        return _restore_frame(Image.open(BytesIO(frame_bytes)), mode, alpha)
+    
+    def processed_frames():
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = deque()
+            for index, frame in enumerate(ImageSequence.Iterator(img)):
+                frame_bytes = _encode_frame(frame)
+                pending.append((pool.submit(
+                    _remove_watermark,
+                    frame_bytes,
+                    method,
+                    frame_regions(frame_bytes, frame.size),
+                    overlay_color,
+                    alpha,
+                    frame_budget_ms
+                ), index, frame.mode, _frame_alpha(frame)))
+                if len(pending) >= 2 * max_workers:
+                    yield finish(*pending.popleft())
+            while pending:
+                yield finish(*pending.popleft())
+    
+    frames = processed_frames()
+    first = next(frames)
+    
+    output = BytesIO()
+    if container == 'TIFF':
+        # One compression and resolution for every page
+        compression = source_info.get('compression')
+        if compression not in TIFF_KEPT_COMPRESSIONS or (
+            compression in ('group3', 'group4') and any(mode != '1' for mode in modes)
+        ):
+            compression = 'tiff_deflate'
+        options = {'dpi': source_info['dpi']} if 'dpi' in source_info else {}
+        first.save(output, format='TIFF', save_all=True, append_images=frames,
+                   compression=compression, **options)
+    elif container == 'GIF':
+        # Frames come composited, so transparent areas must be cleared
+        # rather than show the previous frame through
+        options = {'disposal': 2} if transparent else {}
+        first.save(output, format='GIF', save_all=True, append_images=frames,
+                   duration=durations, loop=loop, **options)
+    elif container == 'WEBP':
+        first.save(output, format='WEBP', save_all=True, append_images=frames,
+                   duration=durations, loop=loop, lossless=True)
+    else:  # animated PNG
+        # The APNG encoder walks the frames twice, so they must be a list
+        container = 'PNG'
+        first.save(output, format='PNG', save_all=True, append_images=list(frames),
+                   duration=durations, loop=loop)
+    
+    return output.getvalue(), container, report
+
+
+def _webp_durations(image_bytes: bytes) -> List[int]:
+    """Frame durations (ms) of an animated WebP, read from its ANMF chunks"""
+    data = memoryview(image_bytes)
+    durations = []
+    offset = 12  # past 'RIFF', file size, 'WEBP'
+    while offset + 8 <= len(data):
+        size = int.from_bytes(data[offset + 4:offset + 8], 'little')
+        if data[offset:offset + 4] == b'ANMF':
+            # Frame X, Y, width, height (24 bits each), then the duration
+            durations.append(int.from_bytes(data[offset + 20:offset + 23], 'little'))
+        offset += 8 + size + (size & 1)
+    return durations
+
+
+def _has_alpha(frame: Image.Image) -> bool:
+    """Whether a frame has transparent pixels to keep"""
+    return frame.mode in ('RGBA', 'LA', 'PA') or 'transparency' in frame.info
+
+
+def _frame_alpha(frame: Image.Image) -> Optional[Image.Image]:
+    """Alpha channel of a frame with transparency, else None"""
+    if not _has_alpha(frame):
+        return None
+    return frame.convert('RGBA').getchannel('A')
+
+
+def _restore_frame(
+    frame: Image.Image,
+    mode: str,
+    alpha: Optional[Image.Image]
+) -> Image.Image:
+    """Give a processed RGB frame back its source transparency / bilevel or gray mode"""
+    if alpha is not None:
+        frame = frame.convert('RGB')
+        frame.putalpha(alpha)
+        return frame
+    if mode == '1':
+        # Threshold rather than dither, as fax pages are stored
+        return frame.convert('L').convert('1', dither=Image.Dither.NONE)
+    if mode == 'L':
+        return frame.convert('L')
+    return frame
+
+
+def _encode_frame(frame: Image.Image) -> bytes:
+    """Encode a single frame as PNG bytes (light compression for speed)"""
+    output = BytesIO()
+    frame.convert('RGB').save(output, format='PNG', compress_level=1)
+    return output.getvalue()
+
+
+def count_frames(image_bytes: bytes) -> int:
+    """
+    Number of frames in a multi-page / animated container
+    
+    Only containers that can be re-encoded with all frames (TIFF, GIF,
+    WebP, APNG) report more than one frame.
+    """
+    try:
+        img = Image.open(open_buffer(image_bytes))
+    except Exception:
+        return 1
+    if img.format not in MULTI_FRAME_FORMATS:
+        return 1
+    return getattr(img, 'n_frames', 1)
+
+
 # Utility function to validate image format
 def is_valid_image(image_bytes: bytes) -> bool:
-    """Check if bytes represent a valid image"""
+    """Check if bytes represent a valid image (every frame for multi-frame files)"""
     try:
-        img = Image.open(BytesIO(image_bytes))
+        img = Image.open(open_buffer(image_bytes))
         img.verify()
+        
+        # verify() only looks at the first frame; make sure every other
+        # frame of a multi-page / animated file can be reached
+        if count_frames(image_bytes) > 1:
+            img = Image.open(open_buffer(image_bytes))
+            for _ in ImageSequence.Iterator(img):
+                pass
         return True
     except:
         return False
@@ -218,13 +1012,14 @@ def is_valid_image(image_bytes: bytes) -> bool:
 def get_image_info(image_bytes: bytes) -> dict:
     """Get image metadata"""
     try:
-        img = Image.open(BytesIO(image_bytes))
+        img = Image.open(open_buffer(image_bytes))
         return {
             'format': img.format,
             'mode': img.mode,
             'size': img.size,
             'width': img.width,
-            'height': img.height
+            'height': img.height,
+            'frames': getattr(img, 'n_frames', 1)
         }
     except Exception as e:
         raise ValueError(f"Failed to read image info: {str(e)}")
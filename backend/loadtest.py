@@ -0,0 +1,496 @@
+"""
+Load-test harness for the FastAPI backend
+
+Drives POST /apply-multipart with a configurable mix of synthetic PDF and
+image uploads and reports, per scenario (concurrency x region count):
+throughput, p50/p95/p99 latency, error rate and peak RSS.
+
+Usage:
+    # In-process (ASGI stand-in client, no network)
+    python loadtest.py --concurrency 1,4,16 --regions 1,10 --requests 100
+
+    # Against a local uvicorn server spawned by the harness
+    python loadtest.py --mode uvicorn --port 8765
+
+    # Against an already running server (RSS is not reported)
+    python loadtest.py --url http://localhost:8000
+
+    # Compare admission cost estimates with measured memory peaks
+    python loadtest.py --calibrate
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import math
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from io import BytesIO
+from typing import Any, Dict, List, Optional, Tuple
+
+import cv2
+import httpx
+import numpy as np
+import pikepdf
+
+
+# ---------------------------------------------------------------------------
+# Synthetic payloads
+# ---------------------------------------------------------------------------
+
+def make_image(width: int, height: int, seed: int = 0) -> bytes:
+    """Textured test image with a light text watermark, PNG-encoded"""
+    rng = np.random.default_rng(seed)
+    noise = rng.integers(40, 200, (height, width, 3), dtype=np.uint8)
+    img = cv2.GaussianBlur(noise, (0, 0), 3)
+    cv2.putText(img, "WATERMARK", (width // 8, height // 2),
+                cv2.FONT_HERSHEY_SIMPLEX, width / 400, (235, 235, 235), 4)
+    _, buffer = cv2.imencode('.png', img)
+    return buffer.tobytes()
+
+
+def make_pdf(pages: int) -> bytes:
+    """Letter-size PDF with some text and vector content on every page"""
+    pdf = pikepdf.new()
+    font = pdf.make_indirect(pikepdf.Dictionary(
+        Type=pikepdf.Name.Font,
+        Subtype=pikepdf.Name.Type1,
+        BaseFont=pikepdf.Name.Helvetica,
+    ))
+    for page_num in range(pages):
+        ops = [b"BT /F1 12 Tf"]
+        for line in range(40):
+            ops.append(f"1 0 0 1 72 {740 - line * 16} Tm (Page {page_num} line {line}) Tj".encode())
+        ops.append(b"ET")
+        for i in range(50):
+            ops.append(f"{50 + i * 10} {100 + i * 5} 20 20 re S".encode())
+        content = pdf.make_stream(b"\n".join(ops))
+        pdf.pages.append(pikepdf.Page(pikepdf.Dictionary(
+            Type=pikepdf.Name.Page,
+            MediaBox=[0, 0, 612, 792],
+            Contents=content,
+            Resources=pikepdf.Dictionary(Font=pikepdf.Dictionary(F1=font)),
+        )))
+    output = BytesIO()
+    pdf.save(output)
+    return output.getvalue()
+
+
+def make_actions(
+    kind: str,
+    region_count: int,
+    width: int,
+    height: int,
+    pages: int,
+    rng: random.Random
+) -> List[Dict[str, Any]]:
+    """Random removal actions inside the payload bounds"""
+    actions = []
+    for _ in range(region_count):
+        w = rng.randint(20, max(21, width // 4))
+        h = rng.randint(10, max(11, height // 8))
+        action = {
+            "bbox": [rng.randint(0, width - w), rng.randint(0, height - h), w, h],
+            "method": "cover" if kind == "pdf" else "inpaint",
+        }
+        if kind == "pdf":
+            action["page"] = rng.randrange(pages)
+        actions.append(action)
+    return actions
+
+
+# ---------------------------------------------------------------------------
+# Memory sampling
+# ---------------------------------------------------------------------------
+
+def read_rss(pid: Optional[int] = None) -> int:
+    """Current resident set size in bytes (Linux /proc, else peak RSS)"""
+    path = f"/proc/{pid or 'self'}/status"
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if pid is None:
+        try:
+            import resource  # Unix only
+        except ImportError:
+            return 0
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS, kilobytes elsewhere
+        return peak if sys.platform == "darwin" else peak * 1024
+    return 0
+
+
+class RssSampler:
+    """Background thread tracking the peak RSS of a process"""
+
+    def __init__(self, pid: Optional[int] = None, interval: float = 0.01):
+        self.pid = pid
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, read_rss(self.pid))
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.peak = read_rss(self.pid)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, read_rss(self.pid))
+
+
+# ---------------------------------------------------------------------------
+# Load generation
+# ---------------------------------------------------------------------------
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of a list of values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered)) - 1
+    return ordered[max(0, min(len(ordered) - 1, rank))]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    payloads: Dict[str, Tuple[str, bytes, str]],
+    concurrency: int,
+    region_count: int,
+    total_requests: int,
+    pdf_ratio: float,
+    image_size: Tuple[int, int],
+    pdf_pages: int,
+    seed: int
+) -> Dict[str, Any]:
+    """Fire total_requests uploads with at most `concurrency` in flight"""
+    rng = random.Random(seed)
+    jobs = []
+    for _ in range(total_requests):
+        kind = "pdf" if rng.random() < pdf_ratio else "image"
+        if kind == "pdf":
+            width, height = 612, 792
+        else:
+            width, height = image_size
+        jobs.append((kind, make_actions(kind, region_count, width, height, pdf_pages, rng)))
+
+    latencies: List[float] = []
+    errors = 0
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                kind, actions = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            filename, body, content_type = payloads[kind]
+            start = time.perf_counter()
+            try:
+                response = await client.post(
+                    "/apply-multipart",
+                    files={"file": (filename, body, content_type)},
+                    data={"actions": json.dumps(actions)},
+                )
+                await response.aread()
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "regions": region_count,
+        "requests": total_requests,
+        "throughput_rps": total_requests / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "error_rate": errors / total_requests if total_requests else 0.0,
+    }
+
+
+def start_uvicorn(port: int) -> subprocess.Popen:
+    """Spawn `uvicorn app:app` next to this file and wait for /health"""
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app",
+         "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("uvicorn exited during startup")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").status_code == 200:
+                return server
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("uvicorn did not become healthy within 30s")
+
+
+async def run_all(args: argparse.Namespace) -> List[Dict[str, Any]]:
+    width, height = (int(v) for v in args.image_size.lower().split("x"))
+    payloads = {
+        "image": ("loadtest.png", make_image(width, height), "image/png"),
+        "pdf": ("loadtest.pdf", make_pdf(args.pdf_pages), "application/pdf"),
+    }
+
+    server = None
+    rss_pid: Optional[int] = None
+    timeout = httpx.Timeout(args.timeout)
+    if args.mode == "uvicorn":
+        server = start_uvicorn(args.port)
+        rss_pid = server.pid
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=timeout)
+    elif args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=timeout)
+    else:
+        from app import app
+        client = httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app),
+            base_url="http://loadtest",
+            timeout=timeout,
+        )
+
+    results = []
+    try:
+        async with client:
+            for concurrency in args.concurrency:
+                for region_count in args.regions:
+                    measure_rss = args.mode == "uvicorn" or not args.url
+                    with RssSampler(rss_pid) as sampler:
+                        result = await run_scenario(
+                            client, payloads, concurrency, region_count,
+                            args.requests, args.pdf_ratio, (width, height),
+                            args.pdf_pages, args.seed,
+                        )
+                    result["peak_rss_mb"] = sampler.peak / 2**20 if measure_rss else None
+                    results.append(result)
+                    print_result(result)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+    return results
+
+
+def print_result(result: Dict[str, Any]):
+    rss = result["peak_rss_mb"]
+    print(
+        f"c={result['concurrency']:<4} regions={result['regions']:<4} "
+        f"rps={result['throughput_rps']:8.2f}  "
+        f"p50={result['p50_ms']:8.1f}ms  p95={result['p95_ms']:8.1f}ms  "
+        f"p99={result['p99_ms']:8.1f}ms  "
+        f"errors={result['error_rate'] * 100:5.1f}%  "
+        f"rss={'n/a' if rss is None else f'{rss:.0f}MB'}"
+    )
+
+
+# ---------------------------------------------------------------------------
+# Admission estimator calibration
+# ---------------------------------------------------------------------------
+
+def make_image_pdf(pages: int, width: int, height: int) -> bytes:
+    """PDF with one full-page JPEG photo per page (downsampling payload)"""
+    rng = np.random.default_rng(0)
+    pdf = pikepdf.new()
+    for _ in range(pages):
+        noise = rng.integers(40, 200, (height, width, 3), dtype=np.uint8)
+        _, jpeg = cv2.imencode('.jpg', cv2.GaussianBlur(noise, (0, 0), 3))
+        image = pdf.make_stream(
+            jpeg.tobytes(),
+            Type=pikepdf.Name.XObject,
+            Subtype=pikepdf.Name.Image,
+            Width=width,
+            Height=height,
+            ColorSpace=pikepdf.Name.DeviceRGB,
+            BitsPerComponent=8,
+            Filter=pikepdf.Name.DCTDecode,
+        )
+        pdf.pages.append(pikepdf.Page(pikepdf.Dictionary(
+            Type=pikepdf.Name.Page,
+            MediaBox=[0, 0, 612, 792],
+            Contents=pdf.make_stream(b"q 612 0 0 792 0 0 cm /Im0 Do Q"),
+            Resources=pikepdf.Dictionary(XObject=pikepdf.Dictionary(Im0=image)),
+        )))
+    output = BytesIO()
+    pdf.save(output)
+    return output.getvalue()
+
+
+def _measure_case(kind: str, payload: bytes, options: Dict[str, Any], traced: bool) -> int:
+    """
+    Run one calibration case in a fresh process; returns the tracemalloc
+    peak when traced, else the RSS peak above the pre-run level (0 when it
+    cannot be read)
+
+    Linux lets the peak RSS be reset after a warm-up run, so library
+    initialisation is not counted. tracemalloc keeps a traceback per
+    allocation, which inflates RSS for allocation-heavy work (PDF parsing
+    about 3x), so the two are never measured in the same run.
+    """
+    from image_process import process_image_watermark_removal
+    from redact import apply_redactions, find_watermark_candidates
+
+    if kind == "image":
+        process_image_watermark_removal(make_image(64, 64), **options)
+        work = lambda: process_image_watermark_removal(payload, **options)
+    elif kind == "analyze":
+        find_watermark_candidates(make_pdf(1))
+        work = lambda: find_watermark_candidates(payload)
+    else:
+        warmup = [{"page": 0, "bbox": [0, 0, 10, 10]}]
+        apply_redactions(make_pdf(1), **dict(options, actions=warmup))
+        work = lambda: apply_redactions(payload, **options)
+
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        baseline = read_rss()
+    except OSError:
+        baseline = None
+
+    if traced:
+        tracemalloc.start()
+        work()
+        _, traced_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return traced_peak
+
+    work()
+    rss_peak = 0
+    if baseline is not None:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    rss_peak = int(line.split()[1]) * 1024 - baseline
+    return rss_peak
+
+
+def calibrate(image_size: Tuple[int, int], pdf_pages: int):
+    """
+    Print the admission cost estimate next to the measured tracemalloc and
+    RSS peaks of the same work, one line per method / payload. Each case
+    runs in its own fresh process; the upload itself is added to the
+    measured peak since the estimate counts it too.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    from admission import estimate_analyze_cost, estimate_image_cost, estimate_pdf_cost
+    from bench_page_index import make_dense_page_pdf
+
+    width, height = image_size
+    image = make_image(width, height)
+    small = [(width // 2 - 50, height // 2 - 50, 100, 100)]
+    large = [(width // 8, height // 3, width // 2, height // 4)]
+    pdf = make_pdf(pdf_pages)
+    pdf_actions = [{"page": p, "bbox": [50, 50, 200, 100]} for p in range(pdf_pages)]
+    dense_pdf = make_dense_page_pdf(20000, 2000)
+    delete_actions = [{"page": 0, "bbox": [100, 100, 200, 200], "method": "delete"}]
+    photo_pdf = make_image_pdf(2, width, height)
+    photo_actions = [{"page": 0, "bbox": [10, 10, 20, 20]}]
+
+    cases = [
+        ("image inpaint 100px", estimate_image_cost(image, 'inpaint', small),
+         "image", image, dict(method='inpaint', regions=small)),
+        ("image inpaint 1/8", estimate_image_cost(image, 'inpaint', large),
+         "image", image, dict(method='inpaint', regions=large)),
+        ("image auto", estimate_image_cost(image, 'auto'),
+         "image", image, dict(method='auto', auto_detect=True)),
+        ("image cover", estimate_image_cost(image, 'cover', large),
+         "image", image, dict(method='cover', regions=large)),
+        ("image unblend", estimate_image_cost(image, 'unblend'),
+         "image", image, dict(method='unblend')),
+        (f"pdf {pdf_pages}p cover", estimate_pdf_cost(pdf, pdf_actions),
+         "pdf", pdf, dict(actions=pdf_actions)),
+        ("pdf dense delete", estimate_pdf_cost(dense_pdf, delete_actions),
+         "pdf", dense_pdf, dict(actions=delete_actions)),
+        (f"pdf {pdf_pages}p analyze", estimate_analyze_cost(pdf),
+         "analyze", pdf, {}),
+        ("pdf photo 150dpi", estimate_pdf_cost(photo_pdf, photo_actions, target_dpi=150),
+         "pdf", photo_pdf, dict(actions=photo_actions, optimize=True, target_dpi=150)),
+    ]
+
+    print(f"{'case':<22}{'estimate':>12}{'tracemalloc':>14}{'rss peak':>12}{'est/peak':>10}")
+    context = multiprocessing.get_context("spawn")
+    for name, estimate, kind, payload, options in cases:
+        peaks = []
+        for traced in (True, False):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                peaks.append(pool.submit(_measure_case, kind, payload, options, traced).result())
+        traced_peak, rss_peak = peaks
+        measured = max(traced_peak, rss_peak) + len(payload)
+        print(
+            f"{name:<22}{estimate / 2**20:>10.1f}MB{traced_peak / 2**20:>12.1f}MB"
+            f"{rss_peak / 2**20:>10.1f}MB{estimate / max(measured, 1):>10.2f}"
+        )
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /apply-multipart")
+    parser.add_argument("--mode", choices=["inprocess", "uvicorn"], default="inprocess",
+                        help="in-process ASGI client or a spawned local uvicorn")
+    parser.add_argument("--url", help="target an already running server instead")
+    parser.add_argument("--port", type=int, default=8765, help="port for --mode uvicorn")
+    parser.add_argument("--concurrency", type=int_list, default=[1, 4, 16],
+                        help="comma-separated concurrency levels")
+    parser.add_argument("--regions", type=int_list, default=[1, 10],
+                        help="comma-separated region counts per request")
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario")
+    parser.add_argument("--pdf-ratio", type=float, default=0.5,
+                        help="fraction of uploads that are PDFs (rest are images)")
+    parser.add_argument("--image-size", default="1280x960", help="WIDTHxHEIGHT of test images")
+    parser.add_argument("--pdf-pages", type=int, default=5, help="pages per test PDF")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout (s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="also write results to this JSON file")
+    parser.add_argument("--calibrate", action="store_true",
+                        help="compare admission cost estimates with measured peaks and exit")
+    args = parser.parse_args()
+
+    if args.calibrate:
+        width, height = (int(v) for v in args.image_size.lower().split("x"))
+        calibrate((width, height), args.pdf_pages)
+        return
+
+    results = asyncio.run(run_all(args))
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,435 @@
+"""
+Per-page spatial index of drawn objects
+
+Interprets a page content stream once (tracking the CTM, text matrices,
+fonts and fill alpha) and records the device-independent bbox of every
+text run, image, form XObject and painted path in a uniform grid, so
+"what is drawn inside this bbox" is a cell lookup instead of a rescan.
+
+Coordinates are PDF user space of the page (origin bottom-left), the same
+space as action bboxes.
+"""
+
+import logging
+import math
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import pikepdf
+from pikepdf import Name
+
+logger = logging.getLogger(__name__)
+
+Matrix = Tuple[float, float, float, float, float, float]
+BBox = Tuple[float, float, float, float]  # x0, y0, x1, y1
+
+IDENTITY: Matrix = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+# Grid cell size in points; objects spanning more cells than this go to a
+# list that every query scans (full-page backgrounds, frames)
+GRID_CELL_SIZE = 64.0
+MAX_CELLS_PER_OBJECT = 256
+
+PATH_PAINT_OPERATORS = {'S', 's', 'f', 'F', 'f*', 'B', 'B*', 'b', 'b*'}
+
+
+class DrawnObject(NamedTuple):
+    """One drawing operation with its bbox on the page"""
+    kind: str                 # 'text' | 'image' | 'inline_image' | 'form' | 'path'
+    bbox: BBox
+    op_index: int             # index into PageIndex.operators
+    ctm: Matrix               # text rendering / placement matrix
+    alpha: float              # fill alpha (ExtGState /ca)
+    name: Optional[str] = None        # XObject name or decoded text
+    advance: float = 0.0      # text: total advance in text space
+    font_scale: float = 0.0   # text: font size x horizontal scaling
+    exact: bool = True        # text: advance from the font's own widths
+
+
+def multiply(m1: Matrix, m2: Matrix) -> Matrix:
+    """Concatenate two PDF matrices (apply m1, then m2)"""
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (
+        a1 * a2 + b1 * c2,
+        a1 * b2 + b1 * d2,
+        c1 * a2 + d1 * c2,
+        c1 * b2 + d1 * d2,
+        e1 * a2 + f1 * c2 + e2,
+        e1 * b2 + f1 * d2 + f2,
+    )
+
+
+def transform_bbox(bbox: BBox, m: Matrix) -> BBox:
+    """Axis-aligned bbox of a rectangle after transforming by m"""
+    x0, y0, x1, y1 = bbox
+    a, b, c, d, e, f = m
+    xs = []
+    ys = []
+    for x, y in ((x0, y0), (x1, y0), (x0, y1), (x1, y1)):
+        xs.append(a * x + c * y + e)
+        ys.append(b * x + d * y + f)
+    return (min(xs), min(ys), max(xs), max(ys))
+
+
+def matrix_angle(m: Matrix) -> float:
+    """Rotation of a matrix's x axis in degrees"""
+    return math.degrees(math.atan2(m[1], m[0]))
+
+
+def intersects(a: BBox, b: BBox) -> bool:
+    return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+
+def overlap_fraction(obj: BBox, region: BBox) -> float:
+    """Fraction of obj's area inside region (1.0 for degenerate obj that touches it)"""
+    w = min(obj[2], region[2]) - max(obj[0], region[0])
+    h = min(obj[3], region[3]) - max(obj[1], region[1])
+    if w < 0 or h < 0:
+        return 0.0
+    area = (obj[2] - obj[0]) * (obj[3] - obj[1])
+    if area <= 0:
+        return 1.0
+    return (w * h) / area
+
+
+class SpatialGrid:
+    """Uniform grid of object ids keyed by the cells their bbox covers"""
+
+    def __init__(self, cell_size: float = GRID_CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells: Dict[Tuple[int, int], List[int]] = {}
+        self.large: List[int] = []
+
+    def _cell_range(self, bbox: BBox):
+        size = self.cell_size
+        return (
+            math.floor(bbox[0] / size), math.floor(bbox[1] / size),
+            math.floor(bbox[2] / size), math.floor(bbox[3] / size),
+        )
+
+    def insert(self, obj_id: int, bbox: BBox):
+        i0, j0, i1, j1 = self._cell_range(bbox)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > MAX_CELLS_PER_OBJECT:
+            self.large.append(obj_id)
+            return
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                self.cells.setdefault((i, j), []).append(obj_id)
+
+    def candidates(self, bbox: BBox) -> Set[int]:
+        i0, j0, i1, j1 = self._cell_range(bbox)
+        found = set(self.large)
+        if (i1 - i0 + 1) * (j1 - j0 + 1) > len(self.cells):
+            # Query larger than the populated grid: walk the cells instead
+            for ids in self.cells.values():
+                found.update(ids)
+            return found
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                found.update(self.cells.get((i, j), ()))
+        return found
+
+
+class PageIndex:
+    """Drawn objects of one page plus the grid over their bboxes"""
+
+    def __init__(self, operators: List[Any], objects: List[DrawnObject]):
+        self.operators = operators
+        self.objects = objects
+        self.grid = SpatialGrid()
+        for obj_id, obj in enumerate(objects):
+            self.grid.insert(obj_id, obj.bbox)
+
+    def query(self, bbox: BBox, kinds: Optional[Iterable[str]] = None) -> List[DrawnObject]:
+        """Objects whose bbox intersects bbox, in drawing order"""
+        kinds = set(kinds) if kinds else None
+        found = []
+        for obj_id in self.grid.candidates(bbox):
+            obj = self.objects[obj_id]
+            if kinds and obj.kind not in kinds:
+                continue
+            if intersects(obj.bbox, bbox):
+                found.append(obj)
+        found.sort(key=lambda obj: obj.op_index)
+        return found
+
+
+def build_page_index(page: pikepdf.Page) -> PageIndex:
+    """Interpret a page's content stream into a PageIndex"""
+    operators = pikepdf.parse_content_stream(page)
+    interpreter = _Interpreter(page)
+    for op_index, instruction in enumerate(operators):
+        try:
+            interpreter.execute(op_index, instruction)
+        except (TypeError, ValueError, IndexError, KeyError, AttributeError) as e:
+            # Malformed operands: skip the operator like a viewer would
+            logger.debug(f"Skipping operator {op_index}: {str(e)}")
+    return PageIndex(operators, interpreter.objects)
+
+
+class _FontMetrics:
+    """Glyph widths and vertical extent of a font resource"""
+
+    def __init__(self, font):
+        self.two_byte = False
+        self.widths: Dict[int, float] = {}
+        self.default_width = 500.0
+        # False when widths are guessed (standard-14 fonts without /Widths,
+        # missing font resources): bboxes are approximate and advances wrong
+        self.exact = False
+        self.scale = 1.0  # glyph space -> thousandths of text space
+        self.ascent = 800.0
+        self.descent = -200.0
+
+        if font is None:
+            return
+
+        subtype = font.get('/Subtype')
+        descriptor = font.get('/FontDescriptor')
+
+        if subtype == Name.Type0:
+            self.two_byte = True
+            descendant = font.DescendantFonts[0]
+            descriptor = descendant.get('/FontDescriptor')
+            self.default_width = float(descendant.get('/DW', 1000))
+            self._parse_cid_widths(descendant.get('/W'))
+            self.exact = True
+        elif '/Widths' in font:
+            first_char = int(font.get('/FirstChar', 0))
+            for offset, width in enumerate(font.Widths):
+                self.widths[first_char + offset] = float(width)
+            if descriptor is not None:
+                self.default_width = float(descriptor.get('/MissingWidth', 0))
+            self.exact = True
+            if subtype == Name.Type3:
+                self.scale = float(font.FontMatrix[0]) * 1000
+
+        if descriptor is not None:
+            self.ascent = float(descriptor.get('/Ascent', self.ascent)) or self.ascent
+            self.descent = float(descriptor.get('/Descent', self.descent)) or self.descent
+
+    def _parse_cid_widths(self, w_array):
+        if w_array is None:
+            return
+        items = list(w_array)
+        i = 0
+        while i + 1 < len(items):
+            first = int(items[i])
+            if isinstance(items[i + 1], pikepdf.Array):
+                for offset, width in enumerate(items[i + 1]):
+                    self.widths[first + offset] = float(width)
+                i += 2
+            else:
+                last, width = int(items[i + 1]), float(items[i + 2])
+                for cid in range(first, last + 1):
+                    self.widths[cid] = width
+                i += 3
+
+    def codes(self, data: bytes) -> List[int]:
+        if self.two_byte:
+            return [int.from_bytes(data[i:i + 2], 'big') for i in range(0, len(data) - 1, 2)]
+        return list(data)
+
+    def width(self, code: int) -> float:
+        return self.widths.get(code, self.default_width) * self.scale
+
+
+class _Interpreter:
+    """Minimal content stream interpreter that records drawn objects"""
+
+    def __init__(self, page: pikepdf.Page):
+        resources = page.obj.get('/Resources')
+        self.fonts = resources.get('/Font', {}) if resources is not None else {}
+        self.xobjects = resources.get('/XObject', {}) if resources is not None else {}
+        self.ext_gstates = resources.get('/ExtGState', {}) if resources is not None else {}
+        self.font_cache: Dict[str, _FontMetrics] = {}
+
+        self.objects: List[DrawnObject] = []
+        self.stack: List[Dict[str, Any]] = []
+        self.gstate: Dict[str, Any] = {
+            'ctm': IDENTITY,
+            'alpha': 1.0,
+            'font': _FontMetrics(None),
+            'font_size': 0.0,
+            'char_spacing': 0.0,
+            'word_spacing': 0.0,
+            'h_scale': 1.0,
+            'leading': 0.0,
+            'rise': 0.0,
+        }
+        self.tm: Matrix = IDENTITY
+        self.tlm: Matrix = IDENTITY
+        self.path: Optional[List[float]] = None  # [x0, y0, x1, y1]
+
+    # -- helpers -----------------------------------------------------------
+
+    def _add(self, kind: str, bbox: BBox, op_index: int, matrix: Matrix, **extra):
+        self.objects.append(DrawnObject(
+            kind=kind, bbox=bbox, op_index=op_index, ctm=matrix,
+            alpha=self.gstate['alpha'], **extra
+        ))
+
+    def _path_point(self, x: float, y: float):
+        a, b, c, d, e, f = self.gstate['ctm']
+        px, py = a * x + c * y + e, b * x + d * y + f
+        if self.path is None:
+            self.path = [px, py, px, py]
+        else:
+            self.path[0] = min(self.path[0], px)
+            self.path[1] = min(self.path[1], py)
+            self.path[2] = max(self.path[2], px)
+            self.path[3] = max(self.path[3], py)
+
+    def _font(self, name: str) -> _FontMetrics:
+        if name not in self.font_cache:
+            font = self.fonts.get(name) if self.fonts is not None else None
+            try:
+                self.font_cache[name] = _FontMetrics(font)
+            except (TypeError, ValueError, KeyError, AttributeError, IndexError):
+                self.font_cache[name] = _FontMetrics(None)
+        return self.font_cache[name]
+
+    def _move_line(self, tx: float, ty: float):
+        self.tlm = multiply((1.0, 0.0, 0.0, 1.0, tx, ty), self.tlm)
+        self.tm = self.tlm
+
+    def _show_text(self, op_index: int, elements: List[Any]):
+        gs = self.gstate
+        font: _FontMetrics = gs['font']
+        size = gs['font_size']
+        h_scale = gs['h_scale']
+
+        x = 0.0
+        x_min = x_max = 0.0
+        text = []
+        glyphs = 0
+        for element in elements:
+            if isinstance(element, bytes):
+                codes = font.codes(element)
+                glyphs += len(codes)
+                for code in codes:
+                    advance = font.width(code) / 1000 * size + gs['char_spacing']
+                    if code == 32 and not font.two_byte:
+                        advance += gs['word_spacing']
+                    x += advance * h_scale
+                    x_min, x_max = min(x_min, x), max(x_max, x)
+                if not font.two_byte:
+                    text.append(element.decode('latin-1'))
+            else:
+                x -= float(element) / 1000 * size * h_scale
+                x_min, x_max = min(x_min, x), max(x_max, x)
+
+        if not glyphs:
+            # Pure positioning (e.g. a deleted run's stand-in): nothing drawn
+            self.tm = multiply((1.0, 0.0, 0.0, 1.0, x, 0.0), self.tm)
+            return
+
+        rise = gs['rise']
+        box = (x_min, rise + font.descent / 1000 * size, x_max, rise + font.ascent / 1000 * size)
+        matrix = multiply(self.tm, gs['ctm'])
+        self._add(
+            'text', transform_bbox(box, matrix), op_index, matrix,
+            name=''.join(text) or None, advance=x, font_scale=size * h_scale,
+            exact=font.exact
+        )
+        self.tm = multiply((1.0, 0.0, 0.0, 1.0, x, 0.0), self.tm)
+
+    # -- dispatch ----------------------------------------------------------
+
+    def execute(self, op_index: int, instruction):
+        if isinstance(instruction, pikepdf.ContentStreamInlineImage):
+            self._add('inline_image', transform_bbox((0, 0, 1, 1), self.gstate['ctm']),
+                      op_index, self.gstate['ctm'])
+            return
+
+        operands, operator = instruction.operands, str(instruction.operator)
+        gs = self.gstate
+
+        if operator == 'q':
+            self.stack.append(dict(gs))
+        elif operator == 'Q':
+            if self.stack:
+                self.gstate = self.stack.pop()
+        elif operator == 'cm':
+            gs['ctm'] = multiply(tuple(float(v) for v in operands), gs['ctm'])
+        elif operator == 'gs':
+            ext = self.ext_gstates.get(str(operands[0])) if self.ext_gstates is not None else None
+            if ext is not None and '/ca' in ext:
+                gs['alpha'] = float(ext.ca)
+
+        # Text state
+        elif operator == 'BT':
+            self.tm = self.tlm = IDENTITY
+        elif operator == 'Tf':
+            gs['font'] = self._font(str(operands[0]))
+            gs['font_size'] = float(operands[1])
+        elif operator == 'Tc':
+            gs['char_spacing'] = float(operands[0])
+        elif operator == 'Tw':
+            gs['word_spacing'] = float(operands[0])
+        elif operator == 'Tz':
+            gs['h_scale'] = float(operands[0]) / 100
+        elif operator == 'TL':
+            gs['leading'] = float(operands[0])
+        elif operator == 'Ts':
+            gs['rise'] = float(operands[0])
+        elif operator == 'Td':
+            self._move_line(float(operands[0]), float(operands[1]))
+        elif operator == 'TD':
+            gs['leading'] = -float(operands[1])
+            self._move_line(float(operands[0]), float(operands[1]))
+        elif operator == 'Tm':
+            self.tm = self.tlm = tuple(float(v) for v in operands)
+        elif operator == 'T*':
+            self._move_line(0.0, -gs['leading'])
+
+        # Text showing
+        elif operator == 'Tj':
+            self._show_text(op_index, [bytes(operands[0])])
+        elif operator == 'TJ':
+            self._show_text(op_index, [
+                bytes(e) if isinstance(e, pikepdf.String) else e for e in operands[0]
+            ])
+        elif operator == "'":
+            self._move_line(0.0, -gs['leading'])
+            self._show_text(op_index, [bytes(operands[0])])
+        elif operator == '"':
+            gs['word_spacing'] = float(operands[0])
+            gs['char_spacing'] = float(operands[1])
+            self._move_line(0.0, -gs['leading'])
+            self._show_text(op_index, [bytes(operands[2])])
+
+        # XObjects
+        elif operator == 'Do':
+            name = str(operands[0])
+            xobject = self.xobjects.get(name) if self.xobjects is not None else None
+            if xobject is not None and xobject.get('/Subtype') == Name.Form:
+                form_matrix = tuple(float(v) for v in xobject.get('/Matrix', IDENTITY))
+                matrix = multiply(form_matrix, gs['ctm'])
+                box = tuple(float(v) for v in xobject.BBox)
+                self._add('form', transform_bbox(box, matrix), op_index, matrix, name=name)
+            else:
+                self._add('image', transform_bbox((0, 0, 1, 1), gs['ctm']),
+                          op_index, gs['ctm'], name=name)
+
+        # Paths
+        elif operator in ('m', 'l'):
+            self._path_point(float(operands[0]), float(operands[1]))
+        elif operator == 'c':
+            for i in range(0, 6, 2):
+                self._path_point(float(operands[i]), float(operands[i + 1]))
+        elif operator in ('v', 'y'):
+            for i in range(0, 4, 2):
+                self._path_point(float(operands[i]), float(operands[i + 1]))
+        elif operator == 're':
+            x, y, w, h = (float(v) for v in operands)
+            self._path_point(x, y)
+            self._path_point(x + w, y + h)
+            self._path_point(x + w, y)
+            self._path_point(x, y + h)
+        elif operator in PATH_PAINT_OPERATORS:
+            if self.path is not None:
+                self._add('path', tuple(self.path), op_index, gs['ctm'])
+            self.path = None
+        elif operator == 'n':
+            self.path = None
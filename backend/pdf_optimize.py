@@ -0,0 +1,374 @@
+"""
+Output size optimizer for cleaned PDFs
+
+Optional post-processing run before saving:
+  - merge byte-identical streams (images, font programs, ...) and
+    identical font dictionaries, repointing every reference
+  - drop /XObject, /Font and /ExtGState resources no content stream uses
+  - downsample 8-bit RGB/gray images displayed above a target DPI
+
+Returns a report of stored bytes saved per category; duplicate_fonts
+covers both font programs and merged font / descriptor dictionaries. Objects that become
+unreferenced are not written by pikepdf, so no explicit deletion is needed.
+"""
+
+import hashlib
+import io
+import logging
+import math
+import zlib
+from typing import Any, Dict, Optional, Set, Tuple
+
+import pikepdf
+from pikepdf import Pdf, Name, Array, Dictionary, Stream
+from PIL import Image
+
+from page_index import build_page_index
+
+logger = logging.getLogger(__name__)
+
+ObjGen = Tuple[int, int]
+
+# Images are only resampled when this much above the target DPI
+DOWNSAMPLE_THRESHOLD = 1.25
+JPEG_QUALITY = 85
+
+PRUNABLE_RESOURCES = {
+    '/XObject': 'Do',
+    '/Font': 'Tf',
+    '/ExtGState': 'gs',
+}
+
+
+def optimize_pdf(pdf: Pdf, target_dpi: Optional[int] = None) -> Dict[str, int]:
+    """
+    Shrink an open PDF in place
+
+    Args:
+        pdf: Open pikepdf document (modified in place)
+        target_dpi: Downsample images displayed above this resolution
+            (None to keep every image as is)
+
+    Returns:
+        dict of bytes saved per category plus 'total'
+    """
+    report = {
+        "duplicate_images": 0,
+        "duplicate_fonts": 0,
+        "duplicate_other": 0,
+        "unused_resources": 0,
+        "downsampled_images": 0,
+    }
+
+    before = _reachable_streams(pdf)
+    font_files = _font_file_objgens(pdf)
+
+    duplicates = _merge_duplicates(pdf)
+    _prune_unused_resources(pdf)
+
+    after = _reachable_streams(pdf)
+    for objgen, stream in before.items():
+        if objgen in after:
+            continue
+        size = len(stream.read_raw_bytes())
+        if objgen in duplicates:
+            if stream.get('/Subtype') == Name.Image:
+                report["duplicate_images"] += size
+            elif objgen in font_files:
+                report["duplicate_fonts"] += size
+            else:
+                report["duplicate_other"] += size
+        else:
+            report["unused_resources"] += size
+
+    # Merged font / descriptor dictionaries are not streams: count their
+    # serialized size
+    for objgen in duplicates:
+        if objgen not in before:
+            obj = pdf.get_object(objgen)
+            if isinstance(obj, Dictionary):
+                report["duplicate_fonts"] += len(obj.unparse(resolved=True))
+
+    if target_dpi:
+        report["downsampled_images"] = _downsample_images(pdf, target_dpi)
+
+    report["total"] = sum(report.values())
+    logger.info(f"PDF optimization saved {report['total']} bytes: {report}")
+    return report
+
+
+# ---------------------------------------------------------------------------
+# Reachability
+# ---------------------------------------------------------------------------
+
+def _is_ref(value) -> bool:
+    """True for indirect objects (pikepdf returns scalars as Python types)"""
+    return isinstance(value, pikepdf.Object) and value.is_indirect
+
+
+def _reachable_streams(pdf: Pdf) -> Dict[ObjGen, Stream]:
+    """Indirect streams reachable from the trailer, by objgen"""
+    seen: Set[ObjGen] = set()
+    streams: Dict[ObjGen, Stream] = {}
+    stack = [pdf.trailer]
+    while stack:
+        obj = stack.pop()
+        if _is_ref(obj):
+            if obj.objgen in seen:
+                continue
+            seen.add(obj.objgen)
+            if isinstance(obj, Stream):
+                streams[obj.objgen] = obj
+        if isinstance(obj, (Dictionary, Stream)):
+            stack.extend(obj.values())
+        elif isinstance(obj, Array):
+            stack.extend(obj)
+    return streams
+
+
+def _font_file_objgens(pdf: Pdf) -> Set[ObjGen]:
+    """Objgens of embedded font programs (FontDescriptor /FontFile*)"""
+    font_files = set()
+    for obj in pdf.objects:
+        if isinstance(obj, Dictionary) and obj.get('/Type') == Name.FontDescriptor:
+            for key in ('/FontFile', '/FontFile2', '/FontFile3'):
+                font_file = obj.get(key)
+                if _is_ref(font_file):
+                    font_files.add(font_file.objgen)
+    return font_files
+
+
+# ---------------------------------------------------------------------------
+# Duplicate merging
+# ---------------------------------------------------------------------------
+
+def _value_key(value) -> str:
+    """Hashable form of a PDF value; indirect objects by objgen"""
+    if _is_ref(value):
+        return f"R{value.objgen}"
+    return _contents_key(value)
+
+
+def _contents_key(value, skip: Tuple[str, ...] = ()) -> str:
+    """Hashable form of a value's own contents, even if it is indirect"""
+    if isinstance(value, (Dictionary, Stream)):
+        items = sorted((str(k), _value_key(v)) for k, v in value.items() if k not in skip)
+        return "<<" + " ".join(f"{k} {v}" for k, v in items) + ">>"
+    if isinstance(value, Array):
+        return "[" + " ".join(_value_key(v) for v in value) + "]"
+    return repr(value)
+
+
+def _object_key(obj) -> Optional[str]:
+    """Content hash of a mergeable object, None if it must stay unique"""
+    if isinstance(obj, Stream):
+        digest = hashlib.sha256(obj.read_raw_bytes())
+        digest.update(_contents_key(obj, skip=('/Length',)).encode())
+        return "S" + digest.hexdigest()
+    if isinstance(obj, Dictionary) and obj.get('/Type') in (Name.Font, Name.FontDescriptor):
+        return "D" + hashlib.sha256(_contents_key(obj).encode()).hexdigest()
+    return None
+
+
+def _merge_duplicates(pdf: Pdf) -> Set[ObjGen]:
+    """
+    Repoint references to duplicate objects at one canonical copy
+
+    Runs to a fixpoint: merging font programs can make the font
+    descriptors and then the font dictionaries that use them identical.
+
+    Returns:
+        objgens of the objects that were merged away
+    """
+    merged: Set[ObjGen] = set()
+    while True:
+        canonical: Dict[str, Any] = {}
+        replace: Dict[ObjGen, Any] = {}
+        for obj in pdf.objects:
+            if obj.objgen in merged:
+                continue
+            try:
+                key = _object_key(obj)
+            except (pikepdf.PdfError, ValueError, TypeError):
+                continue
+            if key is None:
+                continue
+            if key in canonical:
+                replace[obj.objgen] = canonical[key]
+            else:
+                canonical[key] = obj
+
+        if not replace:
+            return merged
+
+        for obj in pdf.objects:
+            _replace_references(obj, replace)
+        _replace_references(pdf.trailer, replace)
+        merged.update(replace)
+
+
+def _replace_references(container, replace: Dict[ObjGen, Any]):
+    """Swap indirect references in a container (recursing into direct values)"""
+    if isinstance(container, (Dictionary, Stream)):
+        for key in list(container.keys()):
+            value = container[key]
+            if _is_ref(value):
+                if value.objgen in replace:
+                    container[key] = replace[value.objgen]
+            elif isinstance(value, (Dictionary, Array)):
+                _replace_references(value, replace)
+    elif isinstance(container, Array):
+        for i, value in enumerate(container):
+            if _is_ref(value):
+                if value.objgen in replace:
+                    container[i] = replace[value.objgen]
+            elif isinstance(value, (Dictionary, Array)):
+                _replace_references(value, replace)
+
+
+# ---------------------------------------------------------------------------
+# Unused resources
+# ---------------------------------------------------------------------------
+
+def _used_names(content, xobjects, depth: int = 0) -> Dict[str, Set[str]]:
+    """Resource names used by a content stream, per resource category"""
+    used = {category: set() for category in PRUNABLE_RESOURCES}
+    operator_category = {op: category for category, op in PRUNABLE_RESOURCES.items()}
+
+    for instruction in pikepdf.parse_content_stream(content):
+        if isinstance(instruction, pikepdf.ContentStreamInlineImage):
+            continue
+        category = operator_category.get(str(instruction.operator))
+        if category is None or not instruction.operands:
+            continue
+        name = str(instruction.operands[0])
+        used[category].add(name)
+
+        # Forms without their own /Resources draw from the page's
+        xobject = xobjects.get(name) if xobjects is not None else None
+        if (category == '/XObject' and xobject is not None and depth < 8
+                and xobject.get('/Subtype') == Name.Form and '/Resources' not in xobject):
+            for cat, names in _used_names(xobject, xobjects, depth + 1).items():
+                used[cat].update(names)
+    return used
+
+
+def _prune_unused_resources(pdf: Pdf):
+    """Remove named resources that no page content stream references"""
+    if any('/Resources' not in page.obj for page in pdf.pages):
+        # Inherited resources may be shared with pages we cannot see
+        logger.debug("Page with inherited resources, not pruning")
+        return
+
+    # Resource dicts can be shared between pages: prune by the union of
+    # every sharing page's usage
+    usage: Dict[Any, Tuple[Any, Set[str]]] = {}
+    for page_num, page in enumerate(pdf.pages):
+        resources = page.obj.Resources
+        try:
+            used = _used_names(page, resources.get('/XObject'))
+        except pikepdf.PdfError:
+            return  # unparseable content: keep everything
+
+        for category in PRUNABLE_RESOURCES:
+            subdict = resources.get(category)
+            if subdict is None:
+                continue
+            if subdict.is_indirect:
+                key = subdict.objgen
+            elif resources.is_indirect:
+                key = (resources.objgen, category)
+            else:
+                key = (page_num, category)
+            entry = usage.setdefault(key, (subdict, set()))
+            entry[1].update(used[category])
+
+    for subdict, used in usage.values():
+        for name in list(subdict.keys()):
+            if name not in used:
+                del subdict[name]
+
+
+# ---------------------------------------------------------------------------
+# Image downsampling
+# ---------------------------------------------------------------------------
+
+def _downsample_images(pdf: Pdf, target_dpi: int) -> int:
+    """
+    Resample images whose lowest placed resolution exceeds target_dpi
+
+    Placements come from the page index; images also drawn inside form
+    XObjects (not indexed) are left alone.
+
+    Returns:
+        bytes saved
+    """
+    in_forms: Set[ObjGen] = set()
+    for obj in pdf.objects:
+        if isinstance(obj, Stream) and obj.get('/Subtype') == Name.Form:
+            xobjects = obj.get('/Resources', {}).get('/XObject', {})
+            for image in xobjects.values():
+                if _is_ref(image):
+                    in_forms.add(image.objgen)
+
+    # objgen -> (image, largest displayed width, height in points)
+    placements: Dict[ObjGen, Tuple[Stream, float, float]] = {}
+    for page in pdf.pages:
+        xobjects = page.obj.get('/Resources', {}).get('/XObject', {})
+        for placed in build_page_index(page).objects:
+            if placed.kind != 'image':
+                continue
+            image = xobjects.get(placed.name)
+            if not _is_ref(image):
+                continue
+            a, b, c, d, _, _ = placed.ctm
+            width_pts, height_pts = math.hypot(a, b), math.hypot(c, d)
+            _, max_w, max_h = placements.get(image.objgen, (image, 0.0, 0.0))
+            placements[image.objgen] = (image, max(max_w, width_pts), max(max_h, height_pts))
+
+    saved = 0
+    for objgen, (image, width_pts, height_pts) in placements.items():
+        if objgen in in_forms or not width_pts or not height_pts:
+            continue
+        try:
+            saved += _downsample_image(image, width_pts, height_pts, target_dpi)
+        except (pikepdf.PdfError, OSError, ValueError, NotImplementedError) as e:
+            logger.debug(f"Skipping image {objgen}: {str(e)}")
+    return saved
+
+
+def _downsample_image(image: Stream, width_pts: float, height_pts: float, target_dpi: int) -> int:
+    """Resample one image in place; returns bytes saved (0 if left as is)"""
+    if (image.get('/BitsPerComponent') != 8
+            or image.get('/ColorSpace') not in (Name.DeviceRGB, Name.DeviceGray)
+            or any(key in image for key in ('/SMask', '/Mask', '/Decode', '/ImageMask'))):
+        return 0
+
+    width, height = int(image.Width), int(image.Height)
+    dpi = min(width / (width_pts / 72), height / (height_pts / 72))
+    if dpi <= target_dpi * DOWNSAMPLE_THRESHOLD:
+        return 0
+
+    scale = target_dpi / dpi
+    new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+
+    pil_image = pikepdf.PdfImage(image).as_pil_image()
+    resized = pil_image.resize(new_size, Image.LANCZOS)
+
+    old_size = len(image.read_raw_bytes())
+    if image.get('/Filter') == Name.DCTDecode:
+        output = io.BytesIO()
+        resized.save(output, format='JPEG', quality=JPEG_QUALITY)
+        data, filter_name = output.getvalue(), Name.DCTDecode
+    else:
+        data, filter_name = zlib.compress(resized.tobytes(), 9), Name.FlateDecode
+
+    if len(data) >= old_size:
+        return 0
+
+    image.write(data, filter=filter_name)
+    image.Width, image.Height = new_size
+    if '/DecodeParms' in image:
+        del image.DecodeParms
+    logger.debug(f"Downsampled image {width}x{height} -> {new_size[0]}x{new_size[1]}")
+    return old_size - len(data)
@@ -5,12 +5,27 @@ Manual watermark removal via cover/redact method
 
 import io
 import logging
-from typing import List, Dict, Any, Optional
+import math
+from typing import List, Dict, Any, Optional, Tuple
 import pikepdf
 from pikepdf import Pdf, Rectangle, Name, Array
 
+from buffers import open_buffer
+from page_index import PageIndex, DrawnObject, build_page_index, matrix_angle, overlap_fraction
+from pdf_optimize import optimize_pdf
+
 logger = logging.getLogger(__name__)
 
+# Share of an object's bbox that must lie inside a delete region for the
+# object to be removed (keeps backgrounds and neighbouring text intact)
+DELETE_MIN_OVERLAP = 0.5
+
+# Object kinds that can be watermarks when repeated across pages
+CANDIDATE_KINDS = {'text': 'TX', 'image': 'IM', 'form': 'XO'}
+# Repeated text drawn upright, opaque and below this size (points on the
+# page) is page furniture: running headers, footers, repeated lines
+WATERMARK_MIN_TEXT_SIZE = 24.0
+
 
 def validate_pdf(pdf_bytes: bytes) -> Dict[str, Any]:
     """
@@ -20,10 +35,11 @@ def validate_pdf(pdf_bytes: bytes) -> Dict[str, Any]:
         dict with 'valid' (bool), 'error' (str), 'page_count' (int)
     """
     try:
-        pdf = Pdf.open(io.BytesIO(pdf_bytes))
+        pdf = Pdf.open(open_buffer(pdf_bytes))
         
         # Check if encrypted with password
         if pdf.is_encrypted:
+            pdf.close()
             return {
                 "valid": False,
                 "error": "PDF is password-protected. Please unlock it first."
@@ -51,8 +67,24 @@ def validate_pdf(pdf_bytes: bytes) -> Dict[str, Any]:
 def apply_redactions(
     pdf_bytes: bytes,
     actions: List[Dict[str, Any]],
-    re_ocr: bool = False
+    re_ocr: bool = False,
+    optimize: bool = False,
+    target_dpi: Optional[int] = None
 ) -> bytes:
+    """Apply redaction actions to PDF (see apply_redactions_with_report)"""
+    output_bytes, _ = apply_redactions_with_report(
+        pdf_bytes, actions, re_ocr=re_ocr, optimize=optimize, target_dpi=target_dpi
+    )
+    return output_bytes
+
+
+def apply_redactions_with_report(
+    pdf_bytes: bytes,
+    actions: List[Dict[str, Any]],
+    re_ocr: bool = False,
+    optimize: bool = False,
+    target_dpi: Optional[int] = None
+) -> Tuple[bytes, Dict[str, int]]:
     """
     Apply redaction actions to PDF
     
@@ -62,71 +94,95 @@ def apply_redactions(
             - page: int (0-indexed)
             - bbox: [x, y, width, height]
             - method: "cover" | "delete" | "inpaint"
+              ("delete" removes the drawn objects inside bbox, falling back
+              to cover when nothing removable is found)
             - color: Optional[str] (hex color for cover, default white)
         re_ocr: Whether to re-OCR (v3 feature, ignored in v1)
+        optimize: Merge duplicate streams/fonts and drop unused resources
+            before saving
+        target_dpi: With optimize, downsample images displayed above this
+            resolution
     
     Returns:
-        Cleaned PDF as bytes
+        (cleaned PDF as bytes, bytes saved per category by the optimizer;
+        empty when optimize is off)
     """
     try:
         # Open PDF with pikepdf
-        pdf = Pdf.open(io.BytesIO(pdf_bytes))
-        
-        # Group actions by page for efficiency
-        actions_by_page: Dict[int, List[Dict]] = {}
-        for action in actions:
-            page_num = action.get("page", 0)
-            if page_num not in actions_by_page:
-                actions_by_page[page_num] = []
-            actions_by_page[page_num].append(action)
-        
-        # Process each page with actions
-        for page_num, page_actions in actions_by_page.items():
-            if page_num < 0 or page_num >= len(pdf.pages):
-                logger.warning(f"Skipping invalid page number: {page_num}")
-                continue
+        pdf = Pdf.open(open_buffer(pdf_bytes))
+        
+        # Closed on every path: pikepdf keeps reading the input buffer
+        # (possibly a shared memory view) until then
+        try:
+            # Group actions by page for efficiency
+            actions_by_page: Dict[int, List[Dict]] = {}
+            for action in actions:
+                page_num = action.get("page", 0)
+                if page_num not in actions_by_page:
+                    actions_by_page[page_num] = []
+                actions_by_page[page_num].append(action)
             
-            page = pdf.pages[page_num]
+            # Page indexes are built lazily, once per page, and shared by all
+            # of that page's actions
+            page_indexes: Dict[int, PageIndex] = {}
             
-            # Apply each action to the page
-            for action in page_actions:
-                method = action.get("method", "cover")
+            # Process each page with actions
+            for page_num, page_actions in actions_by_page.items():
+                if page_num < 0 or page_num >= len(pdf.pages):
+                    logger.warning(f"Skipping invalid page number: {page_num}")
+                    continue
                 
-                if method == "cover":
-                    _apply_cover_redaction(page, action)
-                elif method == "delete":
-                    # v1: Fall back to cover (native delete in v2 with PyMuPDF)
-                    logger.info("Delete method not yet implemented, using cover")
-                    _apply_cover_redaction(page, action)
-                elif method == "inpaint":
-                    # v3: Inpainting for scanned PDFs
-                    logger.info("Inpaint method not yet implemented, using cover")
-                    _apply_cover_redaction(page, action)
-                else:
-                    logger.warning(f"Unknown method: {method}")
-        
-        # Save to bytes buffer
-        output_buffer = io.BytesIO()
-        pdf.save(
-            output_buffer,
-            linearize=True,  # Fast web view
-            compress_streams=True,  # Smaller file size
-            # object_stream_mode=pikepdf.ObjectStreamMode.generate  # Modern PDF
-        )
-        
-        pdf.close()
+                page = pdf.pages[page_num]
+                
+                # Deletes rewrite the original content stream in one pass, so
+                # they run before any cover rectangle is appended
+                delete_actions = [a for a in page_actions if a.get("method") == "delete"]
+                if delete_actions:
+                    if page_num not in page_indexes:
+                        page_indexes[page_num] = build_page_index(page)
+                    _apply_delete_redactions(pdf, page, page_indexes[page_num], delete_actions)
+                
+                # Apply each remaining action to the page
+                for action in page_actions:
+                    method = action.get("method", "cover")
+                    
+                    if method == "cover":
+                        _apply_cover_redaction(pdf, page, action)
+                    elif method == "delete":
+                        continue  # applied above
+                    elif method == "inpaint":
+                        # v3: Inpainting for scanned PDFs
+                        logger.info("Inpaint method not yet implemented, using cover")
+                        _apply_cover_redaction(pdf, page, action)
+                    else:
+                        logger.warning(f"Unknown method: {method}")
+            
+            report: Dict[str, int] = {}
+            if optimize:
+                report = optimize_pdf(pdf, target_dpi=target_dpi)
+            
+            # Save to bytes buffer
+            output_buffer = io.BytesIO()
+            pdf.save(
+                output_buffer,
+                linearize=True,  # Fast web view
+                compress_streams=True,  # Smaller file size
+                # object_stream_mode=pikepdf.ObjectStreamMode.generate  # Modern PDF
+            )
+        finally:
+            pdf.close()
         
         output_bytes = output_buffer.getvalue()
         logger.info(f"Redacted PDF size: {len(output_bytes)} bytes")
         
-        return output_bytes
+        return output_bytes, report
         
     except Exception as e:
         logger.error(f"Redaction error: {str(e)}")
         raise RuntimeError(f"Failed to apply redactions: {str(e)}")
 
 
-def _apply_cover_redaction(page, action: Dict[str, Any]):
+def _apply_cover_redaction(pdf: Pdf, page, action: Dict[str, Any]):
     """
     Apply cover/redact by drawing opaque rectangle
     
@@ -143,11 +199,11 @@ def _apply_cover_redaction(page, action: Dict[str, Any]):
     color = action.get("color", "#FFFFFF")  # Default white
     
     # Convert hex color to RGB (0-1 range)
-    rgb = _hex_to_rgb(color)
+    rgb = hex_to_rgb(color)
     
     # Get or create page content stream
     if "/Contents" not in page:
-        page.Contents = pikepdf.Stream(pdf=page.obj.pdf, data=b"")
+        page.Contents = pikepdf.Stream(pdf, b"")
     
     # Build redaction rectangle command
     # PDF coordinates: origin at bottom-left
@@ -161,21 +217,185 @@ def _apply_cover_redaction(page, action: Dict[str, Any]):
     ).encode('latin-1')
     
     # Append to page content
-    if isinstance(page.Contents, list):
+    if isinstance(page.Contents, (list, Array)):
         # Multiple content streams - append to last one
         existing_stream = page.Contents[-1]
         new_data = existing_stream.read_bytes() + b"\n" + redaction_ops
-        page.Contents[-1] = pikepdf.Stream(page.obj.pdf, new_data)
+        page.Contents[-1] = pikepdf.Stream(pdf, new_data)
     else:
         # Single content stream
         existing_data = page.Contents.read_bytes()
         new_data = existing_data + b"\n" + redaction_ops
-        page.Contents = pikepdf.Stream(page.obj.pdf, new_data)
+        page.Contents = pikepdf.Stream(pdf, new_data)
     
     logger.debug(f"Applied cover redaction at {bbox} with color {color}")
 
 
-def _hex_to_rgb(hex_color: str) -> tuple:
+def _apply_delete_redactions(
+    pdf: Pdf,
+    page,
+    index: PageIndex,
+    actions: List[Dict[str, Any]]
+):
+    """
+    Remove the text runs, images, XObjects and paths inside each bbox
+    
+    Objects are looked up in the page index and dropped from the content
+    stream; removed text is replaced by an equal text-space advance so the
+    rest of the line keeps its position. Actions that hit nothing
+    removable (e.g. content inside a form XObject), or text in a font
+    without glyph widths (standard-14 fonts), fall back to cover.
+    """
+    to_remove: Dict[int, DrawnObject] = {}
+    fallback: List[Dict[str, Any]] = []
+    
+    for action in actions:
+        bbox = action.get("bbox")
+        if not bbox or len(bbox) != 4:
+            logger.warning("Invalid bbox, skipping action")
+            continue
+        
+        x, y, width, height = (float(v) for v in bbox)
+        region = (x, y, x + width, y + height)
+        hits = [
+            obj for obj in index.query(region)
+            if overlap_fraction(obj.bbox, region) >= DELETE_MIN_OVERLAP
+        ]
+        
+        if not hits:
+            logger.info(f"Nothing removable at {bbox}, using cover")
+            fallback.append(action)
+            continue
+        
+        if any(obj.kind == 'text' and not obj.exact for obj in hits):
+            # The stand-in advance would shift the rest of the line
+            logger.info(f"Text at {bbox} has no font widths, using cover")
+            fallback.append(action)
+            continue
+        
+        for obj in hits:
+            to_remove[obj.op_index] = obj
+    
+    if to_remove:
+        operators = []
+        for op_index, instruction in enumerate(index.operators):
+            obj = to_remove.get(op_index)
+            if obj is None:
+                operators.append(instruction)
+            else:
+                operators.extend(_replacement_operators(obj, instruction))
+        
+        page.Contents = pdf.make_stream(pikepdf.unparse_content_stream(operators))
+        logger.debug(f"Deleted {len(to_remove)} objects from page")
+    
+    # Covers append to the (possibly rewritten) stream
+    for action in fallback:
+        _apply_cover_redaction(pdf, page, action)
+
+
+def _replacement_operators(obj: DrawnObject, instruction) -> list:
+    """Operators that stand in for a deleted object"""
+    if obj.kind == 'path':
+        # Keep the path (and any clip set on it) but end it unpainted
+        return [([], pikepdf.Operator('n'))]
+    
+    if obj.kind != 'text':
+        return []  # images, XObjects: drop the placement entirely
+    
+    ops = []
+    operator = str(instruction.operator)
+    if operator == '"':
+        aw, ac = instruction.operands[0], instruction.operands[1]
+        ops.append(([aw], pikepdf.Operator('Tw')))
+        ops.append(([ac], pikepdf.Operator('Tc')))
+    if operator in ("'", '"'):
+        ops.append(([], pikepdf.Operator('T*')))
+    
+    # Advance the text matrix as the removed run would have
+    if obj.font_scale and obj.advance:
+        shift = -obj.advance / obj.font_scale * 1000
+        ops.append(([Array([round(shift, 3)])], pikepdf.Operator('TJ')))
+    return ops
+
+
+def find_watermark_candidates(pdf_bytes: bytes) -> Dict[str, Any]:
+    """
+    Find drawn objects that look like watermarks
+    
+    A text run, image or XObject drawn with the same content, angle, alpha
+    and position on at least half the pages (and at least two) is a
+    candidate; on single-page documents rotated or translucent objects are
+    reported with lower confidence. Text is only considered when it is
+    rotated, translucent or at least WATERMARK_MIN_TEXT_SIZE points tall,
+    so running headers and footers are not reported. Each page is indexed
+    once.
+    
+    Returns:
+        dict with 'pages' (int), 'candidates' (list of dicts with page,
+        bbox [x, y, width, height], kind ('text' | 'image' | 'form'),
+        angle, alpha, confidence, signature) and, when nothing was found,
+        'message'
+    """
+    pdf = Pdf.open(open_buffer(pdf_bytes))
+    try:
+        page_count = len(pdf.pages)
+        occurrences: Dict[tuple, List[tuple]] = {}
+        
+        for page_num, page in enumerate(pdf.pages):
+            seen = set()
+            for obj in build_page_index(page).objects:
+                prefix = CANDIDATE_KINDS.get(obj.kind)
+                if prefix is None:
+                    continue
+                angle = round(matrix_angle(obj.ctm)) % 360
+                if obj.kind == 'text' and _is_page_furniture(obj, angle):
+                    continue
+                signature = f"{prefix}:{obj.name or ''}:{angle}:{obj.alpha:.2f}"
+                key = (signature, tuple(round(v) for v in obj.bbox))
+                if key in seen:
+                    continue
+                seen.add(key)
+                occurrences.setdefault(key, []).append((page_num, obj, angle))
+    finally:
+        pdf.close()
+    
+    min_pages = max(2, math.ceil(page_count / 2))
+    candidates = []
+    for (signature, _), hits in occurrences.items():
+        if len(hits) >= min_pages:
+            confidence = min(0.99, len(hits) / page_count)
+        elif page_count == 1 and (hits[0][2] % 90 != 0 or hits[0][1].alpha < 1.0):
+            confidence = 0.5
+        else:
+            continue
+        
+        for page_num, obj, angle in hits:
+            x0, y0, x1, y1 = obj.bbox
+            candidates.append({
+                "page": page_num,
+                "bbox": [round(x0, 2), round(y0, 2), round(x1 - x0, 2), round(y1 - y0, 2)],
+                "kind": obj.kind,
+                "angle": angle,
+                "alpha": obj.alpha,
+                "confidence": round(confidence, 2),
+                "signature": signature,
+            })
+    
+    candidates.sort(key=lambda c: (c["page"], -c["confidence"]))
+    result = {"pages": page_count, "candidates": candidates}
+    if not candidates:
+        result["message"] = "No repeated, rotated or translucent objects found; select watermarks manually."
+    return result
+
+
+def _is_page_furniture(obj: DrawnObject, angle: int) -> bool:
+    """Upright, opaque text at body size (what headers and footers look like)"""
+    a, b, c, d = obj.ctm[:4]
+    size = obj.font_scale * math.sqrt(abs(a * d - b * c))
+    return angle % 90 == 0 and obj.alpha >= 1.0 and size < WATERMARK_MIN_TEXT_SIZE
+
+
+def hex_to_rgb(hex_color: str) -> tuple:
     """
     Convert hex color to RGB tuple (0-1 range for PDF)
     
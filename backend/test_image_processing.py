@@ -3,6 +3,8 @@ Quick test script for image watermark removal
 Run this to verify OpenCV and PIL are working correctly
 """
 
+import json
+import math
 import sys
 
 print("🧪 Testing Image Processing Dependencies...\n")
@@ -129,6 +131,171 @@ except Exception as e:
     traceback.print_exc()
     sys.exit(1)
 
+# Test 8: Reverse alpha blending
+print("\n8️⃣  Testing unblend...")
+try:
+    # Blend a 50% white overlay onto a gray image
+    gray_img = np.full((100, 100, 3), 100, dtype=np.uint8)
+    blended = gray_img.copy()
+    blended[40:60, 20:80] = 178  # 0.5 * 255 + 0.5 * 100
+    _, buffer = cv2.imencode('.png', blended)
+
+    result_bytes, _ = process_image_watermark_removal(
+        buffer.tobytes(),
+        method='unblend',
+        regions=[(10, 30, 80, 40)]
+    )
+    result = cv2.imdecode(np.frombuffer(result_bytes, np.uint8), cv2.IMREAD_COLOR)
+    error = np.abs(result.astype(int) - gray_img.astype(int)).max()
+    if error > 2:
+        print(f"   ❌ Unblend left residual error: {error}")
+        sys.exit(1)
+    
+    # Text overlay over texture: a given alpha must leave uncovered pixels
+    # alone, and a colored overlay's color is estimated
+    texture = cv2.GaussianBlur(
+        np.random.default_rng(1).integers(60, 160, (200, 400, 3), dtype=np.uint8), (0, 0), 3
+    )
+    text_mask = np.zeros(texture.shape[:2], dtype=np.uint8)
+    cv2.putText(text_mask, "WM", (120, 130), cv2.FONT_HERSHEY_SIMPLEX, 3, 255, 10)
+    covered = text_mask > 0
+    for overlay, options in (((255, 255, 255), dict(alpha=0.4)), ((0, 0, 255), {})):
+        opacity = 0.4 * covered[..., None]
+        blended = (opacity * np.array(overlay) + (1 - opacity) * texture).round().astype(np.uint8)
+        _, buffer = cv2.imencode('.png', blended)
+        result_bytes, _ = process_image_watermark_removal(
+            buffer.tobytes(), method='unblend', regions=[(80, 40, 260, 120)], **options
+        )
+        result = cv2.imdecode(np.frombuffer(result_bytes, np.uint8), cv2.IMREAD_COLOR)
+        diff = np.abs(result.astype(int) - texture.astype(int)).mean(axis=2)
+        if diff[~covered].max() > 0 or diff[covered].mean() > 3:
+            print(f"   ❌ Text overlay {overlay} {options}: covered error "
+                  f"{diff[covered].mean():.1f}, uncovered {diff[~covered].max():.1f}")
+            sys.exit(1)
+    print(f"   ✅ Unblend works (max error: {error})")
+except Exception as e:
+    print(f"   ❌ Unblend failed: {e}")
+    sys.exit(1)
+
+# Test 9: Per-region inpainting strategy
+print("\n9️⃣  Testing inpainting strategy selection...")
+try:
+    from image_process import process_image_watermark_removal_with_report
+    
+    # Flat left half, noisy right half, a watermark on each
+    mixed = np.full((200, 400, 3), 128, dtype=np.uint8)
+    mixed[:, 200:] = np.random.default_rng(0).integers(0, 256, (200, 200, 3), dtype=np.uint8)
+    cv2.putText(mixed, "WM", (40, 110), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3)
+    cv2.putText(mixed, "WM", (260, 110), cv2.FONT_HERSHEY_SIMPLEX, 1.5, (255, 255, 255), 3)
+    _, buffer = cv2.imencode('.png', mixed)
+    regions = [(30, 70, 90, 50), (250, 70, 90, 50)]
+    
+    _, _, report = process_image_watermark_removal_with_report(
+        buffer.tobytes(), method='inpaint', regions=regions
+    )
+    strategies = [entry['strategy'] for entry in report]
+    if strategies[0] != 'fill' or strategies[1] not in ('telea', 'ns'):
+        print(f"   ❌ Unexpected strategies: {strategies}")
+        sys.exit(1)
+    
+    # No time budget: everything falls back to the cheapest fill
+    _, _, report = process_image_watermark_removal_with_report(
+        buffer.tobytes(), method='inpaint', regions=regions, time_budget_ms=0
+    )
+    if any(entry['strategy'] != 'fill' for entry in report):
+        print(f"   ❌ Zero budget did not fall back to fill: {report}")
+        sys.exit(1)
+    
+    # Regions too large for the target scale still get the coarsest
+    # pyramid when there is time for it
+    from image_process import _fit_strategy, PYRAMID_MAX_FACTOR
+    fitted = _fit_strategy('pyramid', 1100 * 1100, math.inf)
+    if fitted[:2] != ('pyramid', PYRAMID_MAX_FACTOR):
+        print(f"   ❌ Large region with unlimited budget got: {fitted}")
+        sys.exit(1)
+    
+    # The header summary stays bounded however many regions there are
+    from image_process import summarize_inpaint_report
+    summary = summarize_inpaint_report(report * 100)
+    if (summary['regions'] != 200 or not summary['truncated']
+            or len(json.dumps(summary)) > 8192):
+        print(f"   ❌ Inpaint report summary not bounded: {len(json.dumps(summary))} bytes")
+        sys.exit(1)
+    print(f"   ✅ Strategy selection works ({', '.join(strategies)})")
+except Exception as e:
+    print(f"   ❌ Strategy selection failed: {e}")
+    sys.exit(1)
+
+# Test 10: Multi-frame round trip
+print("\n🔟 Testing multi-frame round trip...")
+try:
+    from io import BytesIO
+    from PIL import Image, ImageSequence
+    
+    frames = []
+    for i in range(4):
+        frame = np.full((80, 120, 3), 40 * i, dtype=np.uint8)
+        cv2.putText(frame, "WM", (30, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2)
+        frames.append(Image.fromarray(frame))
+    durations = [50, 80, 120, 200]
+    
+    for container, options in (('GIF', dict(duration=durations, loop=0)), ('TIFF', {})):
+        source = BytesIO()
+        frames[0].save(source, format=container, save_all=True,
+                       append_images=frames[1:], **options)
+        result_bytes, output_format = process_image_watermark_removal(
+            source.getvalue(), method='inpaint', regions=[(25, 20, 70, 40)]
+        )
+        output = Image.open(BytesIO(result_bytes))
+        if output_format != container or output.n_frames != len(frames):
+            print(f"   ❌ {container}: got {output_format} with {output.n_frames} frames")
+            sys.exit(1)
+        if container == 'GIF':
+            got = [frame.info.get('duration') for frame in ImageSequence.Iterator(output)]
+            if got != durations:
+                print(f"   ❌ GIF durations changed: {got}")
+                sys.exit(1)
+    
+    # Bilevel fax TIFF keeps its mode, Group 4 compression and resolution
+    pages = [Image.new('1', (400, 300), 1) for _ in range(3)]
+    for page in pages:
+        page.paste(0, (100, 100, 300, 150))
+    source = BytesIO()
+    pages[0].save(source, format='TIFF', save_all=True, append_images=pages[1:],
+                  compression='group4', dpi=(204, 196))
+    result_bytes, _ = process_image_watermark_removal(
+        source.getvalue(), method='cover', regions=[(100, 100, 200, 50)]
+    )
+    output = Image.open(BytesIO(result_bytes))
+    kept = (output.mode, output.info.get('compression'), tuple(output.info.get('dpi', ())))
+    if kept != ('1', 'group4', (204, 196)) or output.n_frames != 3:
+        print(f"   ❌ Fax TIFF came back as {kept}, {output.n_frames} pages")
+        sys.exit(1)
+    
+    # GIF transparency survives
+    transparent = []
+    for i in range(3):
+        rgba = np.zeros((80, 120, 4), dtype=np.uint8)
+        rgba[..., 0] = 60 * i + 40
+        rgba[20:60, 20:100, 3] = 255
+        transparent.append(Image.fromarray(rgba, 'RGBA'))
+    source = BytesIO()
+    transparent[0].save(source, format='GIF', save_all=True, append_images=transparent[1:],
+                        duration=durations[:3], loop=0, disposal=2)
+    result_bytes, _ = process_image_watermark_removal(
+        source.getvalue(), method='inpaint', regions=[(40, 30, 40, 20)]
+    )
+    for frame in ImageSequence.Iterator(Image.open(BytesIO(result_bytes))):
+        alpha = np.array(frame.convert('RGBA'))[..., 3]
+        if alpha[0, 0] != 0 or alpha[40, 60] != 255:
+            print("   ❌ GIF transparency was lost")
+            sys.exit(1)
+    print(f"   ✅ GIF and TIFF keep {len(frames)} frames and their timing, "
+          f"fax TIFF mode / compression / dpi and GIF transparency")
+except Exception as e:
+    print(f"   ❌ Multi-frame round trip failed: {e}")
+    sys.exit(1)
+
 # Success!
 print("\n" + "="*50)
 print("✅ ALL TESTS PASSED!")
@@ -0,0 +1,139 @@
+"""
+Quick test script for the PDF size optimizer
+Run this to verify duplicate merging, unused resource pruning and image
+downsampling
+"""
+
+import io
+import random
+import sys
+import zlib
+
+import pikepdf
+from pikepdf import Dictionary, Name
+
+from pdf_optimize import optimize_pdf
+
+print("🧪 Testing PDF optimizer...\n")
+
+
+def make_image(pdf, size, seed=0):
+    """Indirect RGB image stream of noise, so it does not compress away"""
+    width, height = size
+    pixels = random.Random(seed).randbytes(width * height * 3)
+    return pdf.make_stream(
+        zlib.compress(pixels),
+        Type=Name.XObject,
+        Subtype=Name.Image,
+        Width=width,
+        Height=height,
+        ColorSpace=Name.DeviceRGB,
+        BitsPerComponent=8,
+        Filter=Name.FlateDecode,
+    )
+
+
+def add_page(pdf, contents, fonts=None, xobjects=None):
+    resources = Dictionary()
+    if fonts:
+        resources.Font = Dictionary(fonts)
+    if xobjects:
+        resources.XObject = Dictionary(xobjects)
+    pdf.pages.append(pikepdf.Page(Dictionary(
+        Type=Name.Page,
+        MediaBox=[0, 0, 612, 792],
+        Contents=pdf.make_stream(contents),
+        Resources=resources,
+    )))
+
+
+def saved(pdf):
+    """Reopen a document after saving, as the API returns it"""
+    output = io.BytesIO()
+    pdf.save(output)
+    return pikepdf.Pdf.open(io.BytesIO(output.getvalue()))
+
+
+def count_objects(pdf, subtype):
+    return sum(1 for obj in pdf.objects
+               if isinstance(obj, (Dictionary, pikepdf.Stream)) and obj.get('/Subtype') == subtype)
+
+
+# Test 1: Identical font dictionaries are merged and counted
+print("1️⃣  Testing duplicate fonts...")
+try:
+    pdf = pikepdf.new()
+    for _ in range(3):
+        font = pdf.make_indirect(Dictionary(Type=Name.Font, Subtype=Name.Type1, BaseFont=Name.Helvetica))
+        add_page(pdf, b"BT /F1 12 Tf 50 700 Td (Hello) Tj ET", fonts={'/F1': font})
+    report = optimize_pdf(pdf)
+    fonts = count_objects(saved(pdf), Name.Type1)
+    if fonts != 1 or report["duplicate_fonts"] <= 0:
+        print(f"   ❌ Expected one font and bytes saved: {fonts} fonts, {report}")
+        sys.exit(1)
+    print(f"   ✅ 3 fonts -> 1 ({report['duplicate_fonts']} bytes)")
+except Exception as e:
+    print(f"   ❌ Font merging failed: {e}")
+    sys.exit(1)
+
+# Test 2: Byte-identical images are stored once
+print("\n2️⃣  Testing duplicate images...")
+try:
+    pdf = pikepdf.new()
+    for _ in range(2):
+        add_page(pdf, b"q 100 0 0 100 50 50 cm /Im0 Do Q", xobjects={'/Im0': make_image(pdf, (64, 64))})
+    size = len(pdf.pages[1].Resources.XObject.Im0.read_raw_bytes())
+    report = optimize_pdf(pdf)
+    images = count_objects(saved(pdf), Name.Image)
+    if images != 1 or report["duplicate_images"] != size:
+        print(f"   ❌ Expected one image and {size} bytes saved: {images} images, {report}")
+        sys.exit(1)
+    print(f"   ✅ 2 images -> 1 ({size} bytes)")
+except Exception as e:
+    print(f"   ❌ Image merging failed: {e}")
+    sys.exit(1)
+
+# Test 3: XObjects no content stream draws are dropped
+print("\n3️⃣  Testing unused resource pruning...")
+try:
+    pdf = pikepdf.new()
+    add_page(pdf, b"q 100 0 0 100 50 50 cm /Used Do Q", xobjects={
+        '/Used': make_image(pdf, (32, 32)),
+        '/Unused': make_image(pdf, (48, 48), seed=1),
+    })
+    report = optimize_pdf(pdf)
+    result = saved(pdf)
+    names = set(result.pages[0].Resources.XObject.keys())
+    if names != {'/Used'} or count_objects(result, Name.Image) != 1 or report["unused_resources"] <= 0:
+        print(f"   ❌ Unused XObject kept: {names}, {report}")
+        sys.exit(1)
+    print(f"   ✅ Unused XObject removed ({report['unused_resources']} bytes)")
+except Exception as e:
+    print(f"   ❌ Pruning failed: {e}")
+    sys.exit(1)
+
+# Test 4: Images shown above target_dpi are resampled, others kept
+print("\n4️⃣  Testing image downsampling...")
+try:
+    pdf = pikepdf.new()
+    # 1000px across 100pt = 720 DPI; 200px across 100pt = 144 DPI
+    add_page(pdf, b"q 100 0 0 100 50 50 cm /Big Do Q q 100 0 0 100 200 50 cm /Small Do Q", xobjects={
+        '/Big': make_image(pdf, (1000, 1000)),
+        '/Small': make_image(pdf, (200, 200), seed=1),
+    })
+    report = optimize_pdf(pdf, target_dpi=150)
+    result = saved(pdf)
+    xobjects = result.pages[0].Resources.XObject
+    big, small = (int(xobjects.Big.Width), int(xobjects.Big.Height)), (int(xobjects.Small.Width), int(xobjects.Small.Height))
+    if big != (208, 208) or small != (200, 200) or report["downsampled_images"] <= 0:
+        print(f"   ❌ Unexpected sizes: big {big}, small {small}, {report}")
+        sys.exit(1)
+    print(f"   ✅ 720 DPI image -> 150 DPI, 144 DPI image kept ({report['downsampled_images']} bytes)")
+except Exception as e:
+    print(f"   ❌ Downsampling failed: {e}")
+    sys.exit(1)
+
+# Success!
+print("\n" + "="*50)
+print("✅ ALL TESTS PASSED!")
+print("="*50)
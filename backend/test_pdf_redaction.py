@@ -0,0 +1,193 @@
+"""
+Quick test script for PDF redaction and watermark detection
+Run this to verify delete / cover rewrite content streams correctly and
+that /analyze finds stamps without reporting page furniture
+"""
+
+import io
+import sys
+
+import pikepdf
+from pikepdf import Array, Dictionary, Name
+
+from page_index import build_page_index
+from redact import apply_redactions, find_watermark_candidates
+
+print("🧪 Testing PDF redaction...\n")
+
+
+def make_font(pdf, widths=True):
+    font = Dictionary(Type=Name.Font, Subtype=Name.Type1, BaseFont=Name.Helvetica)
+    if widths:
+        # Every glyph 600 units wide, like a monospaced font
+        font.FirstChar = 32
+        font.LastChar = 126
+        font.Widths = Array([600] * 95)
+    return pdf.make_indirect(font)
+
+
+def make_pdf(contents, widths=True, pages=1):
+    """PDF whose pages draw `contents` (bytes, or a list of bytes for a /Contents array)"""
+    pdf = pikepdf.new()
+    font = make_font(pdf, widths)
+    for _ in range(pages):
+        if isinstance(contents, list):
+            stream = Array([pdf.make_stream(data) for data in contents])
+        else:
+            stream = pdf.make_stream(contents)
+        pdf.pages.append(pikepdf.Page(Dictionary(
+            Type=Name.Page,
+            MediaBox=[0, 0, 612, 792],
+            Contents=stream,
+            Resources=Dictionary(Font=Dictionary(F1=font)),
+        )))
+    output = io.BytesIO()
+    pdf.save(output)
+    return output.getvalue()
+
+
+def page_objects(pdf_bytes, page_num=0):
+    """(kind, name, bbox) of every object drawn on a page"""
+    pdf = pikepdf.Pdf.open(io.BytesIO(pdf_bytes))
+    try:
+        return [(obj.kind, obj.name, obj.bbox)
+                for obj in build_page_index(pdf.pages[page_num]).objects]
+    finally:
+        pdf.close()
+
+
+def content(pdf_bytes, page_num=0):
+    pdf = pikepdf.Pdf.open(io.BytesIO(pdf_bytes))
+    try:
+        page = pdf.pages[page_num]
+        streams = page.Contents if isinstance(page.Contents, Array) else [page.Contents]
+        return b"\n".join(stream.read_bytes() for stream in streams)
+    finally:
+        pdf.close()
+
+
+def delete_action(bbox):
+    x0, y0, x1, y1 = bbox
+    return {"page": 0, "bbox": [x0, y0, x1 - x0, y1 - y0], "method": "delete"}
+
+
+def text_bbox(objects, name):
+    return next(bbox for kind, text, bbox in objects if kind == 'text' and text == name)
+
+
+# Test 1: Deleting a run keeps the rest of the line in place
+print("1️⃣  Testing text delete...")
+try:
+    source = make_pdf(b"BT /F1 12 Tf 50 100 Td (Hello) Tj (World) Tj ET")
+    before = page_objects(source)
+    result = apply_redactions(source, [delete_action(text_bbox(before, "Hello"))])
+    after = page_objects(result)
+    if b"(Hello)" in content(result) or [name for _, name, _ in after] != ["World"]:
+        print(f"   ❌ Hello was not removed: {content(result)}")
+        sys.exit(1)
+    if abs(text_bbox(after, "World")[0] - text_bbox(before, "World")[0]) > 0.01:
+        print(f"   ❌ World moved: {text_bbox(before, 'World')} -> {text_bbox(after, 'World')}")
+        sys.exit(1)
+    print("   ✅ Run removed, following run keeps its position")
+except Exception as e:
+    print(f"   ❌ Text delete failed: {e}")
+    sys.exit(1)
+
+# Test 2: ' moves to the next line even when its run is deleted
+print("\n2️⃣  Testing next-line text operators...")
+try:
+    source = make_pdf(b"BT /F1 12 Tf 14 TL 50 700 Td (First) Tj (Second) ' (Third) Tj ET")
+    before = page_objects(source)
+    result = apply_redactions(source, [delete_action(text_bbox(before, "Second"))])
+    after = page_objects(result)
+    if text_bbox(after, "Third")[:2] != text_bbox(before, "Third")[:2]:
+        print(f"   ❌ Third moved: {text_bbox(before, 'Third')} -> {text_bbox(after, 'Third')}")
+        sys.exit(1)
+    print("   ✅ Line break kept for the deleted run")
+except Exception as e:
+    print(f"   ❌ Next-line delete failed: {e}")
+    sys.exit(1)
+
+# Test 3: Paths are ended unpainted, not dropped
+print("\n3️⃣  Testing path delete...")
+try:
+    source = make_pdf(b"0 0 1 rg 200 200 100 50 re f BT /F1 12 Tf 50 100 Td (Keep) Tj ET")
+    result = apply_redactions(source, [delete_action((200, 200, 300, 250))])
+    stream = content(result)
+    if [kind for kind, _, _ in page_objects(result)] != ['text'] or b"re\nn" not in stream:
+        print(f"   ❌ Unexpected content after path delete: {stream}")
+        sys.exit(1)
+    print("   ✅ Path replaced by n")
+except Exception as e:
+    print(f"   ❌ Path delete failed: {e}")
+    sys.exit(1)
+
+# Test 4: Pages whose /Contents is an array of streams
+print("\n4️⃣  Testing multi-stream pages...")
+try:
+    source = make_pdf([b"BT /F1 12 Tf 50 100 Td (Hello) Tj", b"(World) Tj ET"])
+    before = page_objects(source)
+    result = apply_redactions(source, [delete_action(text_bbox(before, "World"))])
+    if [name for _, name, _ in page_objects(result)] != ["Hello"]:
+        print(f"   ❌ Delete across streams failed: {content(result)}")
+        sys.exit(1)
+    result = apply_redactions(source, [{"page": 0, "bbox": [45, 95, 80, 20], "method": "cover"}])
+    if b"re\nf" not in content(result) or b"(World)" not in content(result):
+        print(f"   ❌ Cover on a stream array failed: {content(result)}")
+        sys.exit(1)
+    print("   ✅ Delete and cover work on /Contents arrays")
+except Exception as e:
+    print(f"   ❌ Multi-stream page failed: {e}")
+    sys.exit(1)
+
+# Test 5: Standard-14 fonts without /Widths fall back to cover
+print("\n5️⃣  Testing fonts without widths...")
+try:
+    source = make_pdf(b"BT /F1 12 Tf 50 100 Td (Hello) Tj (World) Tj ET", widths=False)
+    before = page_objects(source)
+    result = apply_redactions(source, [delete_action(text_bbox(before, "Hello"))])
+    stream = content(result)
+    if b"(Hello) Tj (World) Tj" not in stream or b"re\nf" not in stream or b"TJ" in stream:
+        print(f"   ❌ Expected an untouched run under a cover: {stream}")
+        sys.exit(1)
+    print("   ✅ Cover used instead of guessing advances")
+except Exception as e:
+    print(f"   ❌ Font fallback failed: {e}")
+    sys.exit(1)
+
+# Test 6: Watermark candidates
+print("\n6️⃣  Testing watermark detection...")
+try:
+    page = (
+        # Running header, footer and a repeated body line
+        b"BT /F1 10 Tf 1 0 0 1 72 760 Tm (Quarterly Report) Tj ET\n"
+        b"BT /F1 10 Tf 1 0 0 1 72 30 Tm (Company Confidential) Tj ET\n"
+        b"BT /F1 12 Tf 1 0 0 1 72 600 Tm (Thank you for reading.) Tj ET\n"
+        # Rotated translucent stamp
+        b"q /GS1 gs BT /F1 60 Tf 0.7071 0.7071 -0.7071 0.7071 150 250 Tm (DRAFT) Tj ET Q"
+    )
+    source = make_pdf(page, pages=3)
+    pdf = pikepdf.Pdf.open(io.BytesIO(source))
+    for pdf_page in pdf.pages:
+        pdf_page.Resources.ExtGState = Dictionary(GS1=Dictionary(Type=Name.ExtGState, ca=0.3))
+    output = io.BytesIO()
+    pdf.save(output)
+    pdf.close()
+
+    result = find_watermark_candidates(output.getvalue())
+    signatures = {c["signature"] for c in result["candidates"]}
+    if signatures != {"TX:DRAFT:45:0.30"} or len(result["candidates"]) != 3:
+        print(f"   ❌ Unexpected candidates: {sorted(signatures)}")
+        sys.exit(1)
+    if any(c["confidence"] < 0.9 or c["kind"] != "text" for c in result["candidates"]):
+        print(f"   ❌ Stamp not ranked as a watermark: {result['candidates'][0]}")
+        sys.exit(1)
+    print("   ✅ Rotated stamp found on every page, headers / footers ignored")
+except Exception as e:
+    print(f"   ❌ Watermark detection failed: {e}")
+    sys.exit(1)
+
+# Success!
+print("\n" + "="*50)
+print("✅ ALL TESTS PASSED!")
+print("="*50)
@@ -0,0 +1,163 @@
+"""
+Quick test script for the worker-process pool (PROCESS_WORKERS)
+Run this to verify uploads and results round-trip through shared memory
+and that worker errors reach the API process unchanged, a dead
+worker does not break the pool and cancelled requests leave no segments
+"""
+
+import asyncio
+import io
+import os
+import signal
+import sys
+
+import cv2
+import numpy as np
+import pikepdf
+
+from buffers import SharedBuffer
+from workers import ProcessingPool
+
+
+async def run_checks(pool: ProcessingPool):
+    # Test 1: Image success
+    print("1️⃣  Testing image round trip...")
+    image = np.full((120, 160, 3), 128, dtype=np.uint8)
+    image[40:80, 40:120] = 255
+    _, buffer = cv2.imencode('.png', image)
+    upload = SharedBuffer.from_bytes(buffer.tobytes())
+    try:
+        result, output_format, report = await pool.process_image(
+            upload, method='inpaint', regions=[(40, 40, 80, 40)]
+        )
+        try:
+            cleaned = cv2.imdecode(np.frombuffer(bytes(result.view), np.uint8), cv2.IMREAD_COLOR)
+        finally:
+            result.release(unlink=True)
+    finally:
+        upload.release(unlink=True)
+    if output_format != 'PNG' or cleaned is None or len(report) != 1:
+        print(f"   ❌ Unexpected result: {output_format}, {report}")
+        sys.exit(1)
+    print(f"   ✅ Image processed in worker ({report[0]['strategy']})")
+
+    # Test 2: Image failure keeps the real error
+    print("\n2️⃣  Testing image failure...")
+    upload = SharedBuffer.from_bytes(buffer.tobytes())
+    try:
+        await pool.process_image(
+            upload, method='unblend', regions=[(40, 40, 80, 40)], alpha=np.ones((1, 1))
+        )
+        print("   ❌ Bad alpha map was accepted")
+        sys.exit(1)
+    except ValueError as e:
+        if "Alpha map shape" not in str(e):
+            print(f"   ❌ Worker error was replaced: {e}")
+            sys.exit(1)
+        print(f"   ✅ Worker error reported: {e}")
+    finally:
+        upload.release(unlink=True)
+
+    # Test 3: PDF failure keeps the real error
+    print("\n3️⃣  Testing PDF failure...")
+    pdf = pikepdf.new()
+    pdf.add_blank_page()
+    output = io.BytesIO()
+    pdf.save(output)
+    upload = SharedBuffer.from_bytes(output.getvalue())
+    try:
+        await pool.apply_redactions(
+            upload, actions=[{"page": 0, "bbox": [10, 10, 50, 50], "color": 5}]
+        )
+        print("   ❌ Bad cover color was accepted")
+        sys.exit(1)
+    except RuntimeError as e:
+        if "exported pointers" in str(e):
+            print(f"   ❌ Worker error was replaced: {e}")
+            sys.exit(1)
+        print(f"   ✅ Worker error reported: {e}")
+    finally:
+        upload.release(unlink=True)
+
+    # Test 4: The worker is still usable after failures
+    print("\n4️⃣  Testing worker after failures...")
+    upload = SharedBuffer.from_bytes(output.getvalue())
+    try:
+        result, _ = await pool.apply_redactions(
+            upload, actions=[{"page": 0, "bbox": [10, 10, 50, 50]}]
+        )
+        result.release(unlink=True)
+    finally:
+        upload.release(unlink=True)
+    print("   ✅ PDF processed in worker")
+
+    # Test 5: A killed worker does not break later requests
+    print("\n5️⃣  Testing recovery from a dead worker...")
+    for process in list(pool.executor._processes.values()):
+        os.kill(process.pid, signal.SIGKILL)
+    await asyncio.sleep(0.5)
+    outcomes = []
+    for _ in range(2):
+        upload = SharedBuffer.from_bytes(output.getvalue())
+        try:
+            result, _ = await pool.apply_redactions(
+                upload, actions=[{"page": 0, "bbox": [10, 10, 50, 50]}]
+            )
+            result.release(unlink=True)
+            outcomes.append("ok")
+        except RuntimeError as e:
+            # Only the request caught by the dying executor may fail
+            outcomes.append(str(e))
+        finally:
+            upload.release(unlink=True)
+    if outcomes[-1] != "ok":
+        print(f"   ❌ Pool did not recover: {outcomes}")
+        sys.exit(1)
+    print(f"   ✅ Pool replaced after the worker was killed ({outcomes[0]})")
+
+    # Test 6: A cancelled request leaves no result segment behind
+    if os.path.isdir("/dev/shm"):
+        print("\n6️⃣  Testing cancelled request cleanup...")
+        segments = set(os.listdir("/dev/shm"))
+        large = np.random.default_rng(0).integers(0, 256, (2000, 3000, 3), dtype=np.uint8)
+        _, large_buffer = cv2.imencode('.png', large)
+        upload = SharedBuffer.from_bytes(large_buffer.tobytes())
+        task = asyncio.ensure_future(pool.process_image(upload, method='auto', auto_detect=True))
+        await asyncio.sleep(0.2)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        # The single worker finishes the cancelled task before this one
+        small = SharedBuffer.from_bytes(buffer.tobytes())
+        try:
+            result, _, _ = await pool.process_image(small, method='cover', regions=[(0, 0, 10, 10)])
+            result.release(unlink=True)
+        finally:
+            small.release(unlink=True)
+            upload.release(unlink=True)
+        await asyncio.sleep(0.2)
+        leaked = set(os.listdir("/dev/shm")) - segments
+        if leaked:
+            print(f"   ❌ Segments left behind: {leaked}")
+            sys.exit(1)
+        print("   ✅ Result of the cancelled request was unlinked")
+
+
+def main():
+    print("🧪 Testing worker-process pool...\n")
+    pool = ProcessingPool(1)
+    try:
+        asyncio.run(run_checks(pool))
+    finally:
+        pool.shutdown()
+
+    print("\n" + "="*50)
+    print("✅ ALL TESTS PASSED!")
+    print("="*50)
+
+
+# Worker processes are spawned and re-import this module
+if __name__ == "__main__":
+    main()
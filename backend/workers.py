@@ -0,0 +1,142 @@
+"""
+Worker-process pool with zero-copy buffer handoff
+
+When PROCESS_WORKERS > 0, image and PDF processing run in separate
+processes. Uploads are read straight into shared memory, workers operate
+on memoryviews / ndarray views of that segment, and results come back in a
+second segment the API process streams from, so no multi-hundred-MB payload
+is ever pickled.
+"""
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import UploadFile
+
+from buffers import SharedBuffer
+
+logger = logging.getLogger(__name__)
+
+PROCESS_WORKERS = int(os.environ.get("PROCESS_WORKERS", "0"))
+
+
+def _publish(data) -> Tuple[str, int]:
+    """Copy a worker result into a new segment owned by the API process"""
+    result = SharedBuffer.from_bytes(data)
+    result.release()  # keep the segment; the API process unlinks it
+    return result.name, result.size
+
+
+def _image_task(name: str, size: int, kwargs: Dict[str, Any]) -> Tuple[str, int, Tuple[str, List[Dict]]]:
+    from image_process import process_image_watermark_removal_with_report
+
+    with SharedBuffer.attach(name, size) as upload:
+        result, output_format, report = process_image_watermark_removal_with_report(
+            upload.view, **kwargs
+        )
+    return (*_publish(result), (output_format, report))
+
+
+def _pdf_task(name: str, size: int, kwargs: Dict[str, Any]) -> Tuple[str, int, Dict[str, int]]:
+    from redact import apply_redactions_with_report
+
+    with SharedBuffer.attach(name, size) as upload:
+        result, report = apply_redactions_with_report(upload.view, **kwargs)
+    return (*_publish(result), report)
+
+
+def _discard_result(future: Future):
+    """Unlink the segment a worker published for a request no longer waiting"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    name, size, _ = future.result()
+    try:
+        SharedBuffer.attach(name, size).release(unlink=True)
+    except FileNotFoundError:
+        pass
+
+
+async def read_upload(file: UploadFile) -> SharedBuffer:
+    """Copy an upload from its spooled temp file into shared memory"""
+    size = file.size
+    if size is None:
+        file.file.seek(0, os.SEEK_END)
+        size = file.file.tell()
+    file.file.seek(0)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, SharedBuffer.from_file, file.file, size)
+
+
+class ProcessingPool:
+    """
+    Process pool that exchanges payloads through SharedBuffers
+
+    A worker that dies (e.g. OOM-killed) breaks the whole executor; the
+    requests it had fail and the executor is replaced for the next ones.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor = self._new_executor()
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # spawn: forking a multi-threaded server process is unsafe
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+
+    def _replace_broken(self, executor: ProcessPoolExecutor):
+        # Concurrent requests on the same broken executor replace it once
+        if self.executor is executor:
+            logger.error("Worker process died; restarting the processing pool")
+            self.executor = self._new_executor()
+            executor.shutdown(wait=False)
+
+    async def _run(self, task, upload: SharedBuffer, kwargs: Dict[str, Any]):
+        executor = self.executor
+        try:
+            future = executor.submit(task, upload.name, upload.size, kwargs)
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            future = self.executor.submit(task, upload.name, upload.size, kwargs)
+        try:
+            name, size, extra = await asyncio.wrap_future(future)
+        except BrokenProcessPool:
+            self._replace_broken(executor)
+            raise RuntimeError("Worker process died while processing the request (out of memory?)")
+        except asyncio.CancelledError:
+            # The worker may still publish a result nobody will attach
+            future.add_done_callback(_discard_result)
+            raise
+        return SharedBuffer.attach(name, size), extra
+
+    async def process_image(self, upload: SharedBuffer, **kwargs) -> Tuple[SharedBuffer, str, List[Dict]]:
+        """process_image_watermark_removal_with_report in a worker; returns (result, format, report)"""
+        result, (output_format, report) = await self._run(_image_task, upload, kwargs)
+        return result, output_format, report
+
+    async def apply_redactions(self, upload: SharedBuffer, **kwargs) -> Tuple[SharedBuffer, Dict[str, int]]:
+        """apply_redactions_with_report in a worker; returns (result, report)"""
+        return await self._run(_pdf_task, upload, kwargs)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+_processing_pool: Optional[ProcessingPool] = None
+
+
+def get_processing_pool() -> Optional[ProcessingPool]:
+    """The shared pool, or None when PROCESS_WORKERS is 0 (in-process threads)"""
+    global _processing_pool
+    if PROCESS_WORKERS > 0 and _processing_pool is None:
+        # Created on first use so worker processes importing this module
+        # never build pools of their own
+        _processing_pool = ProcessingPool(PROCESS_WORKERS)
+    return _processing_pool
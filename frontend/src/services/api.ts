@@ -13,8 +13,9 @@ const api = axios.create({
 export interface WatermarkAction {
   page: number
   bbox: [number, number, number, number]
-  method: 'cover' | 'delete' | 'inpaint'
+  method: 'cover' | 'delete' | 'inpaint' | 'unblend'
   color?: string
+  alpha?: number  // unblend: overlay opacity 0-1
 }
 
 export interface AnalyzeResponse {
@@ -22,7 +23,7 @@ export interface AnalyzeResponse {
   candidates: Array<{
     page: number
     bbox: [number, number, number, number]
-    kind: 'text' | 'logo' | 'scan'
+    kind: 'text' | 'image' | 'form'  // form: a form XObject (reusable drawing)
     angle?: number
     alpha?: number
     confidence: number